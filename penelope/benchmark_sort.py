@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__license__     = 'GPLv3'
+__author__      = 'Alberto Pettarin (pettarin gmail.com)'
+__copyright__   = '2014 Alberto Pettarin (pettarin gmail.com)'
+__version__     = 'v1.00'
+__date__        = '2014-02-14'
+__description__ = 'Time the sequential and the parallel sorts of penelope.py, from 1 to N worker processes'
+
+import multiprocessing, os, random, sys, time
+#Python2#
+import penelope
+#Python3#import penelope3 as penelope
+
+
+### BEGIN random_words ###
+# random_words(n, seed=0)
+# return n random words, some of them with german accent characters,
+# the same ones for the same seed
+def random_words(n, seed=0):
+    #Python2#
+    letters = u'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZäöüß'
+    #Python3#    letters = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZäöüß'
+    generator = random.Random(seed)
+    words = []
+    for i in range(n):
+        word = ''.join([ generator.choice(letters) for j in range(generator.randint(3, 12)) ])
+        #Python2#
+        word = word.encode('utf-8')
+        words.append(word)
+    return words
+### END random_words ###
+
+
+### BEGIN time_sort ###
+# time_sort(function)
+# call function, and return (seconds taken, its result)
+def time_sort(function):
+    start = time.time()
+    result = function()
+    return (time.time() - start, result)
+### END time_sort ###
+
+
+### BEGIN main ###
+# main()
+# sort entries random words (default: 400000) by each sorting key used by penelope.py,
+# in this process as entryStore.sort does with jobs = 1 (e.g., in sort_in_memory),
+# and with sort_in_parallel using 1, 2, 4, ... up to max_jobs worker processes
+# (default: the number of cores), checking that all of them give the same order
+#
+# e.g.:
+# $ python benchmark_sort.py 1000000 8
+def main():
+    entries = 400000
+    max_jobs = multiprocessing.cpu_count()
+    if len(sys.argv) > 1:
+        entries = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        max_jobs = int(sys.argv[2])
+    jobs_list = []
+    jobs = 1
+    while jobs < max_jobs:
+        jobs_list.append(jobs)
+        jobs *= 2
+    jobs_list.append(max_jobs)
+
+    store = penelope.entryStore()
+    for word in random_words(entries):
+        store.append(word, '')
+
+    # collation_de.py is loaded as a collation plugin, as --collation does
+    #Python2#
+    collation_filename = 'collation_de.py'
+    #Python3#    collation_filename = 'collation_de3.py'
+    collation = penelope.check_collation(os.path.join(os.path.dirname(os.path.abspath(__file__)), collation_filename))
+    keys = [
+        ('word', None),
+        ('odyssey_sort_key', penelope.odyssey_sort_key),
+        ('collation_de collate_key', collation.collate_key),
+    ]
+
+    print('%d entries, %d cores' % (entries, multiprocessing.cpu_count()))
+    for (name, key) in keys:
+        seconds, order = time_sort(lambda: sorted(range(len(store)), key=store.sort_key(key)))
+        order = list(order)
+        print('')
+        print('key: %s' % name)
+        print('  in this process:            %7.2f s' % seconds)
+        for jobs in jobs_list:
+            seconds, parallel_order = time_sort(lambda: penelope.sort_in_parallel(store, key, jobs))
+            if list(parallel_order) != order:
+                print('  sort_in_parallel with %d jobs gives another order' % jobs)
+                sys.exit(1)
+            print('  sort_in_parallel, %3d jobs: %7.2f s' % (jobs, seconds))
+### END main ###
+
+
+if __name__ == '__main__':
+    main()
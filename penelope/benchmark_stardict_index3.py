@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__license__     = 'GPLv3'
+__author__      = 'Alberto Pettarin (pettarin gmail.com)'
+__copyright__   = '2014 Alberto Pettarin (pettarin gmail.com)'
+__version__     = 'v1.00'
+__date__        = '2014-02-14'
+__description__ = 'Time the StarDict index reader of penelope.py against the byte-by-byte reader of v1.21'
+
+import os, random, shutil, struct, sys, tempfile, time
+#Python2#import penelope
+#Python3#
+import penelope3 as penelope
+
+
+### BEGIN read_byte_by_byte ###
+# read_byte_by_byte(idx_input_filename, dict_input_filename, ignore_case)
+# the read_from_stardict_format function of penelope.py v1.21,
+# reading the index file byte-by-byte,
+# and returning a list of [ [word, definition] ]
+def read_byte_by_byte(idx_input_filename, dict_input_filename, ignore_case):
+
+    data = []
+
+    # open files
+    idx_input_file = open(idx_input_filename, "rb")
+    dict_input_file = open(dict_input_filename, "rb")
+
+    # read the whole dictionary in memory
+    dict_input = dict_input_file.read()
+
+    # read the index file byte-by-byte
+    #Python2#    word = ""
+    #Python3#
+    word = b''
+    byte = idx_input_file.read(1)
+    while byte:
+        #Python2#        if (byte == '\0'):
+        #Python3#
+        if (byte == b'\0'):
+            # end of current word: read offset and size
+            o = idx_input_file.read(4)
+            oi = int((struct.unpack('>i', o))[0])
+            s = idx_input_file.read(4)
+            si = int((struct.unpack('>i', s))[0])
+
+            # if ignore_case = True, lowercase word
+            #Python3#
+            word = word.decode("utf-8")
+            if ignore_case:
+                word = word.lower()
+
+            # extract the proper definition for word
+            # and append it to current data
+            #Python2#            data += [ [word, dict_input[oi:oi+si] ] ]
+            #Python3#
+            defs = dict_input[oi:oi+si].decode("utf-8")
+            #Python3#
+            data += [ [word, defs] ]
+
+            # reset current word
+            #Python2#            word = ""
+            #Python3#
+            word = b''
+        else:
+            # append current character to current word
+            #Python2#            word += str(byte)
+            #Python3#
+            word += byte
+
+        byte = idx_input_file.read(1)
+
+    idx_input_file.close()
+    dict_input_file.close()
+
+    return data
+### END read_byte_by_byte ###
+
+
+### BEGIN write_random_dictionary ###
+# write_random_dictionary(prefix, headwords, seed=0)
+# write a StarDict dictionary prefix.idx, prefix.dict
+# with the given number of random headwords (sorted), each with a random definition,
+# the same ones for the same seed
+def write_random_dictionary(prefix, headwords, seed=0):
+    generator = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = sorted(set([ ''.join([ generator.choice(letters) for j in range(generator.randint(3, 16)) ]) for i in range(headwords) ]))
+    idx_output_file = open(prefix + ".idx", "wb")
+    dict_output_file = open(prefix + ".dict", "wb")
+    offset = 0
+    for word in words:
+        definition = ' '.join([ generator.choice(words) for j in range(generator.randint(2, 10)) ])
+        definition = definition.encode("utf-8")
+        idx_output_file.write(word.encode("utf-8") + b'\0' + struct.pack('>II', offset, len(definition)))
+        dict_output_file.write(definition)
+        offset += len(definition)
+    idx_output_file.close()
+    dict_output_file.close()
+    return len(words)
+### END write_random_dictionary ###
+
+
+### BEGIN time_read ###
+# time_read(function)
+# call function, and return (seconds taken, its result)
+def time_read(function):
+    start = time.time()
+    result = function()
+    return (time.time() - start, result)
+### END time_read ###
+
+
+### BEGIN main ###
+# main()
+# read a StarDict dictionary (prefix.idx, prefix.dict) with read_byte_by_byte
+# and with read_from_stardict_format, and print the time taken by each,
+# checking that they read the same [word, definition] entries
+# if no prefix is given, a random dictionary with the given number of headwords
+# (default: 500000) is written in a temporary directory, and deleted afterwards
+#
+# e.g.:
+# $ python benchmark_stardict_index.py
+# $ python benchmark_stardict_index.py 1000000
+# $ python benchmark_stardict_index.py foo
+def main():
+    temp_dir = None
+    if (len(sys.argv) > 1) and (not sys.argv[1].isdigit()):
+        prefix = sys.argv[1]
+    else:
+        headwords = 500000
+        if len(sys.argv) > 1:
+            headwords = int(sys.argv[1])
+        temp_dir = tempfile.mkdtemp()
+        prefix = os.path.join(temp_dir, "random")
+        write_random_dictionary(prefix, headwords)
+    idx_input_filename = prefix + ".idx"
+    dict_input_filename = prefix + ".dict"
+    idx_size = os.path.getsize(idx_input_filename)
+    dict_size = os.path.getsize(dict_input_filename)
+
+    # read the files once before timing, so that both readers find them in the cache
+    for filename in [ idx_input_filename, dict_input_filename ]:
+        f = open(filename, "rb")
+        f.read()
+        f.close()
+
+    old_seconds, old_data = time_read(lambda: read_byte_by_byte(idx_input_filename, dict_input_filename, False))
+    new_seconds, new_data = time_read(lambda: [ d.to_list() for d in penelope.read_from_stardict_format(idx_input_filename, dict_input_filename, None, 32, False) ])
+
+    # the index alone, without the definitions
+    idx_input_file = open(idx_input_filename, "rb")
+    idx_input = penelope.map_file(idx_input_file)
+    index_seconds, records = time_read(lambda: sum([ 1 for r in penelope.read_stardict_index(idx_input) ]))
+    penelope.unmap_file(idx_input)
+    idx_input_file.close()
+
+    if temp_dir != None:
+        shutil.rmtree(temp_dir)
+
+    print('%d headwords, %d bytes of index, %d bytes of definitions, Python %d.%d' % (records, idx_size, dict_size, sys.version_info[0], sys.version_info[1]))
+    print('  byte-by-byte reader (v1.21): %7.2f s' % old_seconds)
+    print('  read_from_stardict_format:   %7.2f s' % new_seconds)
+    print('  read_stardict_index only:    %7.2f s' % index_seconds)
+    if old_data != new_data:
+        print('  the readers read different entries')
+        sys.exit(1)
+### END main ###
+
+
+if __name__ == '__main__':
+    main()
+
@@ -9,43 +9,66 @@ __date__        = '2013-01-28'
 __description__ = 'Default collation function for penelope.py'
 
 
+### BEGIN collation tables ###
+# the folding tables of the collation levels, from the first to the last:
+# strings are lowercased, then each table maps characters
+# to their replacement at that level (possibly longer than one character),
+# while characters not in the table are kept as they are
+# strings are compared level by level, and the first level where they differ
+# decides their order
+#
+# to define the collation of another language, change these tables only
+LEVELS = [
+    # 1st level: german accent characters are replaced by base characters
+    #Python2#    { u'ä': u'a', u'ö': u'o', u'ü': u'u', u'ß': u'ss' },
+    #Python3#
+    { 'ä': 'a', 'ö': 'o', 'ü': 'u', 'ß': 'ss' },
+    # 2nd level: strings with original accents
+    { },
+]
+### END collation tables ###
+
+
+### BEGIN translate maps ###
+# LEVELS compiled into the maps used by the translate method of strings
+TRANSLATE_MAPS = [ dict((ord(c), r) for (c, r) in level.items()) for level in LEVELS ]
+### END translate maps ###
+
+
+### BEGIN collate_key ###
+# collate_key(string)
+# return the sorting key of string: the tuple of its folded forms,
+# one per level, encoded in UTF-16
+def collate_key(string):
+    string = lowercase(string)
+    return tuple([ string.translate(m).encode('utf-16') for m in TRANSLATE_MAPS ])
+### END collate_key ###
+
+
 ### BEGIN collate_function ###
 # collate_function(string1, string2)
 # compare string1 to string2
 # return  0 if string1 == string2
 #        -1 if string1 < string2
 #         1 if string1 > string2
+# (like comparing their sorting keys, but folding only the levels needed)
 def collate_function(string1, string2):
-    # conversion to unicode and lower case (only for Python 2)
-    #Python2#    b1 = string1.decode('utf-8')
-    #Python3#
-    b1 = string1
-    #Python2#    b2 = string2.decode('utf-8')
-    #Python3#
-    b2 = string2
-    b1 = b1.lower()
-    b2 = b2.lower()
-    # store strings with original accents for 2nd level collation
-    c1 = b1
-    c2 = b2
-
-    # replace german accent characters by base characters for 1st level collation
-    #Python2#    for f in [ [u'ä', u'a'], [u'ö', u'o'], [u'ü', u'u'], [u'ß', u'ss'] ]:
-    #Python3#
-    for f in [ ['ä', 'a'], ['ö', 'o'], ['ü', 'u'], ['ß', 'ss'] ]:
-        b1 = b1.replace(f[0], f[1])
-        b2 = b2.replace(f[0], f[1])
-
-    # 1st level collation
-    if b1.encode('utf-16') == b2.encode('utf-16'):
-        # 2nd level collation
-        if c1.encode('utf-16') == c2.encode('utf-16'):
-            return 0
-        else:
-            return -1 if c1.encode('utf-16') < c2.encode('utf-16') else 1
-    # 1st level collation
-    else:
-        return -1 if b1.encode('utf-16') < b2.encode('utf-16') else 1
+    string1 = lowercase(string1)
+    string2 = lowercase(string2)
+    for m in TRANSLATE_MAPS:
+        b1 = string1.translate(m).encode('utf-16')
+        b2 = string2.translate(m).encode('utf-16')
+        if b1 != b2:
+            return -1 if b1 < b2 else 1
+    return 0
 ### END collate_function ###
 
 
+### BEGIN lowercase ###
+# lowercase(string)
+# conversion to unicode (only for Python 2) and lower case
+def lowercase(string):
+    #Python2#    string = string.decode('utf-8')
+    return string.lower()
+### END lowercase ###
+
@@ -24,3 +24,16 @@ def collate_function(string1, string2):
         return -1 if (b1 < b2) else 1
 ### END collate_function ###
 
+
+### BEGIN collate_key ###
+# collate_key(string)
+# return the sorting key of string, such that
+# comparing the sorting keys of string1 and string2
+# gives the same result as collate_function(string1, string2)
+# (optional: it makes sorting faster, but collate_function must be defined anyway)
+def collate_key(string):
+    if not isinstance(string, bytes):
+        string = string.encode('utf-8')
+    return string.lower()
+### END collate_key ###
+
@@ -10,7 +10,7 @@ __description__ = 'Parse the given definition list for penelope.py'
 
 ### BEGIN parse ###
 # parse(data, type_sequence, ignore_case)
-# parse the given list of pairs
+# parse the given pairs, read one at a time (data is an iterable, not a list)
 # data = [ [word, definition] ]
 # with type_sequence and ignore_case options,
 # and outputs the following list:
@@ -35,7 +35,7 @@ __description__ = 'Penelope is a multi-tool for creating, editing and converting
 #
 ### END changelog ###
 
-import collections, getopt, gzip, imp, os, sqlite3, struct, subprocess, sys, zipfile, xml.sax.saxutils
+import array, bisect, collections, functools, getopt, gzip, heapq, imp, itertools, marshal, mmap, multiprocessing.pool, os, re, shutil, sqlite3, struct, subprocess, sys, tempfile, zipfile, zlib, xml.sax.saxutils
 #Python2#from dictEPUB import dictEPUB
 #Python3#
 from dictEPUB3 import dictEPUB3
@@ -52,9 +52,48 @@ from dictEPUB3 import dictEPUB3
 # MARISA_BUILD_PATH="C:\kobo\marisa\marisa-build.exe"
 #
 MARISA_BUILD_PATH="/home/alberto/.bin/marisa-0.2.0/tools/marisa-build"
-MARISA_REVERSE_LOOKUP_PATH="/home/alberto/.bin/marisa-0.2.0/tools/marisa-reverse-lookup"
+MARISA_PREDICTIVE_SEARCH_PATH="/home/alberto/.bin/marisa-0.2.0/tools/marisa-predictive-search"
 ### Path to working MARISA executables ###
 
+# typecode of the arrays holding offsets (unsigned, 64 bit), see offset_array
+# (Python 2 has no 'Q' typecode, while 'L' is 64 bit on 64 bit Linux/Mac OS X only,
+# and 32 bit elsewhere, e.g. on Windows, where offsets are held in lists instead)
+#Python2#OFFSET_TYPECODE = 'L' if (array.array('L').itemsize == 8) else None
+#Python3#
+OFFSET_TYPECODE = 'Q'
+
+# sorting fewer entries than this is not worth starting worker processes
+# (entries are sorted by worker processes only by a sorting key computed in Python,
+# see entryStore.sort)
+PARALLEL_SORT_MIN_ENTRIES = 100000
+
+# module name of the collation plugin loaded by check_collation
+# (the worker processes of sort_in_parallel load it under the same name)
+COLLATION_MODULE_NAME = "penelope_collation"
+
+# number of strings whose sorting key is kept by a collationCache
+COLLATION_CACHE_SIZE = 1048576
+
+# schema of the Odyssey index (page size 1024 bytes),
+# with the single rows of T_DictInfo and T_DictVersion,
+# and its indices, created after T_DictIndex has been filled
+ODYSSEY_INDEX_TABLES = [
+    'CREATE TABLE T_DictVersion(F_Version INTEGER,F_DictType TEXT  )',
+    'CREATE TABLE T_DictInfo(F_Title TEXT,F_Description TEXT,F_Licence TEXT,F_Copyright TEXT,F_Year TEXT,F_LangFrom TEXT,F_LangTo TEXT,F_Alphabet TEXT,F_xhtmlHeader TEXT, F_CollationLevel int DEFAULT 0)',
+    'CREATE TABLE T_DictIndex(F_Key INTEGER,F_Word TEXT COLLATE IcuNoCase,F_Offset INTEGER,F_Size INTEGER,F_ChunckNum INTEGER)',
+    'CREATE TABLE T_RefKey(F_Key INTEGER,F_RefKey INTEGER)',
+    "INSERT INTO T_DictInfo VALUES('','','','','','','','','',0)",
+    "INSERT INTO T_DictVersion VALUES('','')" ]
+ODYSSEY_INDEX_INDICES = [
+    'CREATE INDEX F_WordIndex ON T_DictIndex(F_Word COLLATE IcuNoCase)' ]
+
+# if the marisa_trie module (pip install marisa-trie) is available,
+# Kobo indices are read with it, instead of calling marisa-predictive-search
+try:
+    import marisa_trie
+except ImportError:
+    marisa_trie = None
+
 
 ### BEGIN collate_function_default ###
 # collate_function_default(string1, string2)
@@ -77,256 +116,1812 @@ def collate_function_default(string1, string2):
 ### END collate_function_default ###
 
 
+### BEGIN read_input_dictionaries ###
+# read_input_dictionaries(tasks, jobs)
+# read the input dictionaries described by tasks = [ (read_function, arguments) ],
+# where read_function is one of the read_from_*_format functions,
+# and yield their [word, definition] entries, one at a time, in the order of tasks
+# if jobs > 1, read up to jobs dictionaries at the same time, in worker processes
+# (see read_dictionaries_in_parallel)
+#
+# Note: if each input dictionary is sorted by word,
+# their entries are merged by word instead (entries with the same word
+# come in the order of tasks), hence they are yielded in the same order
+# as sorting their concatenation would give, reading all the inputs at once,
+# and they are returned as sortedEntries, which need not be sorted again
+# sorted dictionaries are read lazily, in this process, whatever jobs is,
+# since merging them needs all of them at the same time
+def read_input_dictionaries(tasks, jobs):
+    if all([ input_is_sorted(task) for task in tasks ]):
+        inputs = [ read_function(*arguments) for (read_function, arguments) in tasks ]
+        if len(inputs) == 1:
+            print_info("The input dictionary is sorted...")
+            return sortedEntries(inputs[0])
+        print_info("The input dictionaries are sorted, merging them...")
+        return sortedEntries(merge_sorted_records(inputs, None))
+    if (jobs > 1) and (len(tasks) > 1):
+        return itertools.chain.from_iterable(read_dictionaries_in_parallel(tasks, jobs))
+    return itertools.chain.from_iterable(read_function(*arguments) for (read_function, arguments) in tasks)
+### END read_input_dictionaries ###
+
+
+### BEGIN read_dictionaries_in_parallel ###
+# read_dictionaries_in_parallel(tasks, jobs)
+# read the input dictionaries described by tasks in jobs worker processes,
+# and yield an entryStore for each of them, one at a time, in the order of tasks
+# at most jobs dictionaries are read ahead of the one being yielded,
+# hence at most jobs + 1 of them are held in memory, however many tasks there are
+# an error in a worker process is raised here, aborting the reading
+def read_dictionaries_in_parallel(tasks, jobs):
+    pool = multiprocessing.Pool(min(jobs, len(tasks)))
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(pool.apply_async(read_input_dictionary, (task, )))
+        if len(pending) > jobs:
+            yield pending.popleft().get()
+    while len(pending) > 0:
+        yield pending.popleft().get()
+    pool.close()
+    pool.join()
+### END read_dictionaries_in_parallel ###
+
+
+### BEGIN sortedEntries ###
+# sortedEntries(entries)
+# the given entries (an iterable), known to be sorted by word,
+# e.g., those read from sorted input dictionaries
+# sorters do not sort them again, and they keep this flag through the built-in parser
+# (which does not change the words), but not through custom parsers
+class sortedEntries(object):
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def __iter__(self):
+        return iter(self.entries)
+### END sortedEntries ###
+
+
+### BEGIN input_is_sorted ###
+# input_is_sorted(task)
+# return True if the input dictionary described by task = (read_function, arguments)
+# is sorted by word, reading its words only
+# (only StarDict and Odyssey dictionaries are checked, since their words
+# can be read without their definitions; the others are assumed not to be sorted)
+def input_is_sorted(task):
+    read_function, arguments = task
+    if read_function == read_from_stardict_format:
+        # definitions are read lazily, hence this reads the index only
+        return is_sorted(d[0] for d in read_function(*arguments))
+    if read_function == read_from_odyssey_format:
+        idx_input_filename, dict_input_filename, ignore_case = arguments
+        return is_sorted(read_odyssey_words(idx_input_filename, ignore_case))
+    return False
+### END input_is_sorted ###
+
+
+### BEGIN is_sorted ###
+# is_sorted(words)
+# return True if the given words are sorted (equal words are allowed),
+# reading them one at a time, and stopping at the first one out of order
+def is_sorted(words):
+    previous = None
+    for word in words:
+        if (previous != None) and (word < previous):
+            return False
+        previous = word
+    return True
+### END is_sorted ###
+
+
+### BEGIN read_input_dictionary ###
+# read_input_dictionary(task)
+# read the input dictionary described by task = (read_function, arguments),
+# and return an entryStore with its entries
+# (run by the worker processes of read_input_dictionaries,
+# since an entryStore is sent back to the main process as a few buffers)
+def read_input_dictionary(task):
+    read_function, arguments = task
+    store = entryStore()
+    store.extend(read_function(*arguments))
+    return store
+### END read_input_dictionary ###
+
+
+### BEGIN parse_entries ###
+# parse_entries(data)
+# the built-in parser: yield [ word, True, synonyms, [], definition ]
+# for each [ word, definition ] entry of data, one at a time,
+# where synonyms are those read from the input dictionary (if any)
+# the entries read lazily are yielded as lazyEntry too,
+# so that their definitions are decoded only if needed
+def parse_entries(data):
+    for d in data:
+        if isinstance(d, lazyEntry):
+            yield lazyEntry(( d[0], True, list(d.synonyms), [] ), d.dict_input, d.offset, d.size)
+        else:
+            yield [ d[0], True, [], [], d[1] ]
+### END parse_entries ###
+
+
+### BEGIN sort_in_memory ###
+# sort_in_memory(entries, key=None, jobs=1)
+# the built-in sorter: store the given parsed entries in an entryStore,
+# sort them by word (or by key(word), if key is not None),
+# keeping the input order of the entries with the same sorting key,
+# and return a view of them in sorted order
+# if jobs > 1, sort using jobs worker processes (see sort_in_parallel)
+# entries given as sortedEntries are not sorted again by word
+#
+# Note: a sorter is any function sorter(entries, key=None) doing the same,
+# which consumes all the entries before returning,
+# and whose result can be iterated over more than once
+def sort_in_memory(entries, key=None, jobs=1):
+    presorted = (key == None) and isinstance(entries, sortedEntries)
+    store = entryStore()
+    for d in entries:
+        store.append_parsed(d)
+    store.sort(key, jobs, presorted)
+    return store.parsed()
+### END sort_in_memory ###
+
+
+### BEGIN parallelSorter ###
+# parallelSorter(jobs)
+# a sorter (see sort_in_memory) sorting in memory using jobs worker processes
+class parallelSorter(object):
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    def __call__(self, entries, key=None):
+        return sort_in_memory(entries, key, self.jobs)
+### END parallelSorter ###
+
+
+### BEGIN sort_in_parallel ###
+# sort_in_parallel(store, key, jobs)
+# return the positions of the entries of the given entryStore,
+# sorted as entryStore.sort does, using jobs worker processes
+#
+# Note: this is a sample sort, hence no merge is needed:
+# the sorting keys are split into jobs ranges by splitters, chosen from a sample,
+# each slice of the input is sorted and cut into ranges (first pass),
+# and each range, made of one sorted run per slice, is sorted on its own (second pass)
+# the entries with the same sorting key end up in the same range,
+# in the input order, hence the sort is stable
+# the words and the key are given to each worker process once, when it starts
+# (inheriting them, where worker processes are forked),
+# while the tasks hold positions only
+#
+# Note: a key defined in a collation plugin is given as the file name
+# of the plugin, which the worker processes load again, unless they inherit it,
+# since it cannot be found by its module name in a worker process started anew
+# (e.g., on Windows, or on Mac OS X with Python 3.8 or later)
+def sort_in_parallel(store, key, jobs):
+    n = len(store)
+    words = store.words_only()
+
+    # choose the splitters from an evenly spaced sample of the keys
+    sort_key = store.sort_key(key)
+    sample = sorted([ sort_key(p) for p in range(0, n, max(1, n // (100 * jobs))) ])
+    splitters = [ sample[len(sample) * i // jobs] for i in range(1, jobs) ]
+
+    if getattr(key, "__module__", None) == COLLATION_MODULE_NAME:
+        pool = multiprocessing.Pool(jobs, init_sort_worker, (words, None, sys.modules[COLLATION_MODULE_NAME].__file__))
+    else:
+        pool = multiprocessing.Pool(jobs, init_sort_worker, (words, key, None))
+
+    # sort jobs slices of the input, and cut them into ranges
+    tasks = [ (n * i // jobs, n * (i + 1) // jobs, splitters) for i in range(jobs) ]
+    buckets = [ offset_array() for i in range(jobs) ]
+    for parts in pool.imap(split_positions, tasks):
+        for i in range(jobs):
+            buckets[i].extend(parts[i])
+
+    # sort each range, and concatenate them
+    tasks = [ (bucket, ) for bucket in buckets ]
+    order = offset_array()
+    for positions in pool.imap(sort_positions, tasks):
+        order.extend(positions)
+
+    pool.close()
+    pool.join()
+    return order
+### END sort_in_parallel ###
+
+
+### BEGIN init_sort_worker ###
+# init_sort_worker(words, key, collation_filename)
+# store the entryStore holding the words to be sorted, and the sorting key,
+# in the worker process running this (see sort_in_parallel)
+# if collation_filename is not None, the key is the collate_key
+# of the collation plugin in collation_filename, loaded unless already loaded
+#
+# Note: an error loading the plugin is raised by the tasks of this worker process,
+# so that it reaches the main process, while an error raised here
+# would only make the pool start another worker process, over and over
+sort_worker_words = None
+sort_worker_key = None
+sort_worker_error = None
+def init_sort_worker(words, key, collation_filename):
+    global sort_worker_words, sort_worker_key, sort_worker_error
+    sort_worker_words = words
+    sort_worker_key = key
+    if collation_filename != None:
+        try:
+            if COLLATION_MODULE_NAME in sys.modules:
+                collation = sys.modules[COLLATION_MODULE_NAME]
+            else:
+                collation = imp.load_source(COLLATION_MODULE_NAME, collation_filename)
+            sort_worker_key = collation.collate_key
+        except Exception as e:
+            sort_worker_error = e
+### END init_sort_worker ###
+
+
+### BEGIN split_positions ###
+# split_positions(task)
+# sort the positions in [start, end) of the entries of words by sorting key,
+# where task = (start, end, splitters), words = sort_worker_words
+# and key = sort_worker_key,
+# and return them as jobs = len(splitters) + 1 arrays of positions,
+# the i-th holding those with a sorting key between the (i-1)-th and the i-th splitter
+# (run by the worker processes of sort_in_parallel)
+def split_positions(task):
+    start, end, splitters = task
+    if sort_worker_error != None:
+        raise sort_worker_error
+    sort_key = sort_worker_words.sort_key(sort_worker_key)
+    keys = [ sort_key(p) for p in range(start, end) ]
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    sorted_keys = [ keys[i] for i in order ]
+    cuts = [ 0 ] + [ bisect.bisect_right(sorted_keys, s) for s in splitters ] + [ len(order) ]
+    parts = []
+    for i in range(len(cuts) - 1):
+        parts.append(offset_array([ start + j for j in order[cuts[i]:cuts[i+1]] ]))
+    return parts
+### END split_positions ###
+
+
+### BEGIN sort_positions ###
+# sort_positions(task)
+# sort the given positions of the entries of words by sorting key,
+# where task = (positions, ), words = sort_worker_words and key = sort_worker_key,
+# and return them as an array
+# (run by the worker processes of sort_in_parallel)
+def sort_positions(task):
+    positions, = task
+    if sort_worker_error != None:
+        raise sort_worker_error
+    return offset_array(sorted(positions, key=sort_worker_words.sort_key(sort_worker_key)))
+### END sort_positions ###
+
+
+### BEGIN externalSorter ###
+# externalSorter(memory_budget, temp_dir=None, max_runs=64, jobs=1)
+# a sorter (see sort_in_memory) using about memory_budget bytes of memory:
+# the entries are sorted in runs which fit in memory_budget
+# (using jobs worker processes, if jobs > 1),
+# each run is written to a temporary file in temp_dir (or in the default one),
+# and the runs are merged while iterating over the returned entries
+# (if there are more than max_runs runs, they are merged in several passes)
+# if the runs do not overlap (e.g., the entries were sorted already),
+# they are concatenated instead
+#
+# e.g., sorter = externalSorter(1024 * 1048576) sorts using about 1 GB of memory
+class externalSorter(object):
+
+    def __init__(self, memory_budget, temp_dir=None, max_runs=64, jobs=1):
+        self.memory_budget = memory_budget
+        self.temp_dir = temp_dir
+        self.max_runs = max_runs
+        self.jobs = jobs
+
+    def __call__(self, entries, key=None):
+        presorted = (key == None) and isinstance(entries, sortedEntries)
+        run_filenames = []
+        # the (first, last) sorting keys of each run
+        run_ranges = []
+        store = entryStore()
+        for d in entries:
+            store.append_parsed(d)
+            if store.memory_usage() > self.memory_budget:
+                store.sort(key, self.jobs, presorted)
+                run_ranges.append(store.key_range(key))
+                run_filenames.append(self.write_run(store.parsed()))
+                store = entryStore()
+        store.sort(key, self.jobs, presorted)
+
+        # everything fits in memory
+        if len(run_filenames) == 0:
+            return store.parsed()
+
+        if len(store) > 0:
+            run_ranges.append(store.key_range(key))
+            run_filenames.append(self.write_run(store.parsed()))
+        store = None
+
+        # each run comes after the previous one, hence they are sorted as a whole
+        if all([ run_ranges[i][1] <= run_ranges[i+1][0] for i in range(len(run_ranges) - 1) ]):
+            return sortedRuns(run_filenames, key, True)
+
+        # merge groups of consecutive runs, until they can be merged at once
+        while len(run_filenames) > self.max_runs:
+            merged_filenames = []
+            for i in range(0, len(run_filenames), self.max_runs):
+                merged = sortedRuns(run_filenames[i:i+self.max_runs], key)
+                merged_filenames.append(self.write_run(merged))
+                merged.remove()
+            run_filenames = merged_filenames
+
+        return sortedRuns(run_filenames, key)
+
+    # write the given entries to a new temporary file, and return its file name
+    def write_run(self, entries):
+        handle, run_filename = tempfile.mkstemp(prefix="penelope.", suffix=".run", dir=self.temp_dir)
+        run_file = os.fdopen(handle, "wb")
+        for d in entries:
+            marshal.dump(d, run_file)
+        run_file.close()
+        return run_filename
+### END externalSorter ###
+
+
+### BEGIN sortedRuns ###
+# sortedRuns(run_filenames, key, concatenate=False)
+# the entries stored in the given run files written by externalSorter,
+# each sorted by word (or by key(word)), which are merged while iterating
+# (entries with the same sorting key come in the order of run_filenames)
+# if concatenate = True, the runs are sorted as a whole, and they are read one after the other
+# the run files are removed when this object is discarded
+class sortedRuns(object):
+
+    def __init__(self, run_filenames, key, concatenate=False):
+        self.run_filenames = run_filenames
+        self.key = key
+        self.concatenate = concatenate
+
+    # remove the run files
+    def remove(self):
+        for run_filename in self.run_filenames:
+            if os.path.exists(run_filename):
+                os.remove(run_filename)
+        self.run_filenames = []
+
+    def __iter__(self):
+        # (a generator, so that the run files live as long as the iteration)
+        runs = [ read_run(run_filename) for run_filename in self.run_filenames ]
+        if self.concatenate:
+            merged = itertools.chain(*runs)
+        else:
+            merged = merge_sorted_records(runs, self.key)
+        for d in merged:
+            yield d
+
+    def __del__(self):
+        self.remove()
+### END sortedRuns ###
+
+
+### BEGIN read_run ###
+# read_run(run_filename)
+# yield the entries stored in the given run file, one at a time
+def read_run(run_filename):
+    run_file = open(run_filename, "rb")
+    while True:
+        try:
+            d = marshal.load(run_file)
+        except EOFError:
+            break
+        yield d
+    run_file.close()
+### END read_run ###
+
+
+### BEGIN indexBuilder ###
+# indexBuilder(definition_file=None)
+# the index of parsed data, built once, and shared by the writers
+#
+# build(data, debug_file=None) reads the given parsed data once,
+# writing the definition of each included word to definition_file
+# (a file opened in binary mode; the definitions are not kept if it is None),
+# and storing a posting (key, number of its definition) for each included word,
+# for each of its synonyms, and for each substitution [ word_to_replace, replacement ]
+# (one for each posting of replacement, after the other postings of word_to_replace)
+# each definition is stored once, however many postings point at it
+# if debug_file is not None, the included words are logged into it,
+# and "\n" is appended to the definitions, for readability
+#
+# e.g., index = indexBuilder(tempfile.TemporaryFile())
+#       index.build(data)
+#       for i in index.sorted_postings(sorter):
+#           write(index.key(i), index.definition(index.reference(i)))
+class indexBuilder(object):
+
+    def __init__(self, definition_file=None):
+        self.definition_file = definition_file
+        self.mapped = None
+        # the offsets of the definitions in definition_file (followed by the end of the last one)
+        self.definition_offsets = offset_array([ 0 ])
+        # the postings: their keys (stored as the words of an entryStore),
+        # the numbers of their definitions, and whether they are synonyms (or substitutions)
+        self.keys = entryStore()
+        self.references = offset_array()
+        self.synonyms = bytearray()
+        # if True, the postings are sorted by key already
+        self.presorted = False
+
+    # read the given parsed data, storing its definitions and its postings
+    def build(self, data, debug_file=None):
+        # the words of sorted data are sorted, while their synonyms might not
+        presorted = isinstance(data, sortedEntries)
+        substitutions = dict()
+        for d in data:
+
+            # get data
+            word = d[0]
+            include = d[1]
+            synonyms = d[2]
+
+            if (include):
+                # append word into log file
+                if debug_file != None:
+                    debug_file.write(word + "\n")
+
+                # augment readability in debug mode
+                n = self.append_definition(d, debug_file != None)
+                self.append_posting(word, n, False)
+                for s in synonyms:
+                    self.append_posting(s, n, True)
+                    presorted = False
+            else:
+                for substitution in d[3]:
+                    substitutions.setdefault(substitution[1], []).append(substitution[0])
+
+        # process substitutions, pointing at the definitions of each posting of the replacement
+        if len(substitutions) > 0:
+            presorted = False
+            for i in range(len(self)):
+                for word_to_replace in substitutions.get(self.key(i), []):
+                    self.append_posting(word_to_replace, self.reference(i), True)
+
+        self.presorted = presorted
+
+    # store the definition of the given parsed entry d (followed by a newline, if newline = True),
+    # and return its number
+    # the definition of a lazyEntry is copied without decoding it,
+    # and without a definition_file, definitions are not even read (they are stored as empty)
+    def append_definition(self, d, newline=False):
+        if self.definition_file == None:
+            self.definition_offsets.append(self.definition_offsets[-1])
+            return len(self.definition_offsets) - 2
+        if isinstance(d, lazyEntry):
+            definition_bytes = d.definition_bytes()
+        else:
+            #Python2#            definition_bytes = d[4]
+            #Python3#
+            definition_bytes = d[4].encode("utf-8")
+        if newline:
+            definition_bytes += b"\n"
+        self.definition_file.write(definition_bytes)
+        self.definition_offsets.append(self.definition_offsets[-1] + len(definition_bytes))
+        return len(self.definition_offsets) - 2
+
+    def append_posting(self, key, n, synonym):
+        self.keys.append(key, "")
+        self.references.append(n)
+        self.synonyms.append(1 if synonym else 0)
+
+    # return the numbers of the postings, sorted by key (or by key(key)) with sorter,
+    # as an array
+    def sorted_postings(self, sorter, key=None):
+        # the keys are stored in memory already, hence in-memory sorters sort them in place
+        if (sorter == sort_in_memory) or isinstance(sorter, parallelSorter):
+            jobs = 1 if sorter == sort_in_memory else sorter.jobs
+            self.keys.sort(key, jobs, self.presorted and (key == None))
+            order = self.keys.order
+            self.keys.order = None
+            if order == None:
+                order = offset_array(range(len(self)))
+            return order
+
+        records = self.posting_records()
+        if self.presorted:
+            records = sortedEntries(records)
+        order = offset_array()
+        order.extend(int(d[4]) for d in sorter(records, key))
+        return order
+
+    # yield the postings as parsed entries [ key, True, [], [], posting number ],
+    # to be sorted by a sorter, one at a time
+    def posting_records(self):
+        for i in range(len(self)):
+            yield [ self.key(i), True, [], [], str(i) ]
+
+    # return the key of the i-th posting
+    def key(self, i):
+        return self.keys.word(i)
+
+    # return the key of the i-th posting, encoded in UTF-8
+    def key_bytes(self, i):
+        return self.keys.word_bytes(i)
+
+    # return the number of the definition of the i-th posting
+    def reference(self, i):
+        return self.references[i]
+
+    # return True if the i-th posting is a synonym (or a substitution)
+    def is_synonym(self, i):
+        return self.synonyms[i] == 1
+
+    # return the number of definitions
+    def definition_count(self):
+        return len(self.definition_offsets) - 1
+
+    # return the total size of the definitions, in bytes
+    def definition_size(self):
+        return self.definition_offsets[-1]
+
+    # return (offset, length) of the n-th definition in definition_file
+    def definition_location(self, n):
+        return (self.definition_offsets[n], self.definition_offsets[n+1] - self.definition_offsets[n])
+
+    # return the n-th definition, reading it from definition_file
+    # (which must be open for reading)
+    def definition(self, n):
+        if self.mapped == None:
+            self.definition_file.flush()
+            self.mapped = map_file(self.definition_file)
+        definition = self.mapped[self.definition_offsets[n]:self.definition_offsets[n+1]]
+        #Python2#        return definition
+        #Python3#
+        return definition.decode("utf-8")
+
+    # copy the definitions into the given file (opened in binary mode)
+    def copy_definitions(self, output_file):
+        self.definition_file.flush()
+        self.definition_file.seek(0)
+        shutil.copyfileobj(self.definition_file, output_file)
+
+    def __len__(self):
+        return len(self.references)
+### END indexBuilder ###
+
+
+### BEGIN build_index ###
+# build_index(data, debug_file)
+# return the indexBuilder of the given parsed data,
+# keeping the definitions in a temporary file,
+# or data itself if it is an indexBuilder already
+# (e.g., an index built once, to produce several outputs from one read)
+def build_index(data, debug_file):
+    if isinstance(data, indexBuilder):
+        return data
+    index = indexBuilder(tempfile.TemporaryFile())
+    index.build(data, debug_file)
+    return index
+### END build_index ###
+
+
+### BEGIN chunkedFile ###
+# chunkedFile(filename_prefix, chunk_size)
+# a file split into the files filename_prefix + "1", filename_prefix + "2", ...:
+# a new file is started as soon as the current one is longer than chunk_size bytes
+class chunkedFile(object):
+
+    def __init__(self, filename_prefix, chunk_size):
+        self.filename_prefix = filename_prefix
+        self.chunk_size = chunk_size
+        self.filenames = []
+        # the offset of the beginning of each file, in the whole
+        self.starts = []
+        self.size = 0
+        self.start_chunk()
+
+    def start_chunk(self):
+        filename = self.filename_prefix + str(len(self.filenames) + 1)
+        self.chunk_file = open(filename, "wb")
+        self.filenames.append(filename)
+        self.starts.append(self.size)
+
+    def write(self, data):
+        self.chunk_file.write(data)
+        self.size += len(data)
+        if self.size - self.starts[-1] > self.chunk_size:
+            self.chunk_file.close()
+            self.start_chunk()
+
+    # return (number of the file, starting from 1, offset in it) of the given offset
+    def location(self, offset):
+        i = bisect.bisect_right(self.starts, offset) - 1
+        return (i + 1, offset - self.starts[i])
+
+    def close(self):
+        self.chunk_file.close()
+### END chunkedFile ###
+
+
+### BEGIN merge_sorted_records ###
+# merge_sorted_records(iterables, key)
+# merge the given iterables of records, each sorted by word (or by key(word)),
+# and yield the records in sorted order, one at a time
+# (records with the same sorting key come in the order of iterables)
+def merge_sorted_records(iterables, key):
+    decorated = [ decorate_records(iterables[i], i, key) for i in range(len(iterables)) ]
+    for item in heapq.merge(*decorated):
+        yield item[-1]
+### END merge_sorted_records ###
+
+
+### BEGIN decorate_records ###
+# decorate_records(records, i, key)
+# yield (sorting key, i, position, record) for the given records,
+# so that records are never compared directly while merging
+def decorate_records(records, i, key):
+    position = 0
+    for r in records:
+        if key == None:
+            yield (r[0], i, position, r)
+        else:
+            yield (key(r[0]), i, position, r)
+        position += 1
+### END decorate_records ###
+
+
 ### BEGIN read_from_stardict_format ###
 # read_from_stardict_format(idx_input_filename,
-#   dict_input_filename, ignore_case)
+#   dict_input_filename, syn_input_filename, offset_bits, ignore_case)
 # read data from the given stardict dictionary
-# and return a list of [ [word, definition] ]
+# and yield its [word, definition] entries, one at a time
 # if ignore_case = True, lowercase all the index word
-def read_from_stardict_format(idx_input_filename, dict_input_filename, ignore_case):
-
-    data = []
+# if syn_input_filename is not None, the synonyms it contains
+# are stored in the synonyms attribute of the entry they point to
+# offset_bits (32 or 64) is the size of the offsets in the index file,
+# as given by the idxoffsetbits field of the .ifo file
+#
+# Note: the definitions are not read here: each entry is a lazyEntry
+# pointing into the memory-mapped .dict file, decoded only when accessed
+# if idx_input_filename ends in .gz, it is decompressed on the fly
+# if dict_input_filename ends in .dz, it is read in place as a dictzip file
+def read_from_stardict_format(idx_input_filename, dict_input_filename, syn_input_filename, offset_bits, ignore_case):
+
+    # read the synonyms, each pointing to an entry by its position in the index
+    synonyms = collections.defaultdict(tuple)
+    if syn_input_filename != None:
+        syn_input_file = open(syn_input_filename, "rb")
+        syn_input = map_file(syn_input_file)
+        for synonym, position in read_stardict_index(syn_input, '>I'):
+            #Python3#
+            synonym = synonym.decode("utf-8")
+            if ignore_case:
+                synonym = synonym.lower()
+            synonyms[position] += ( synonym, )
+        unmap_file(syn_input)
+        syn_input_file.close()
+
+    # map the dictionary file in memory, or open it for random access
+    # if it is compressed with dictzip
+    # (either way the file itself is closed at once, while its mapping
+    # stays valid as long as some entry references it)
+    if dict_input_filename.endswith(".dz"):
+        dict_input = dictzipFile(dict_input_filename)
+    else:
+        dict_input_file = open(dict_input_filename, "rb")
+        dict_input = map_file(dict_input_file)
+        dict_input_file.close()
 
-    # open files
-    idx_input_file = open(idx_input_filename, "rb")
-    dict_input_file = open(dict_input_filename, "rb")
+    # each index record has a 32 or 64 bit offset, and a 32 bit size
+    if offset_bits == 64:
+        record_format = '>QI'
+    else:
+        record_format = '>II'
+
+    # map the index file in memory, and parse it in bulk,
+    # or parse it while decompressing it, if it is compressed with gzip
+    if idx_input_filename.endswith(".gz"):
+        idx_input_file = gzip.open(idx_input_filename, "rb")
+        idx_input = None
+        index = read_stardict_index_stream(idx_input_file, record_format)
+    else:
+        idx_input_file = open(idx_input_filename, "rb")
+        idx_input = map_file(idx_input_file)
+        index = read_stardict_index(idx_input, record_format)
 
-    # read the whole dictionary in memory
-    dict_input = dict_input_file.read()
+    position = 0
+    for word, offset, size in index:
 
-    # read the index file byte-by-byte
-    #Python2#    word = ""
-    #Python3#
-    word = b''
-    byte = idx_input_file.read(1)
-    while byte:
-        #Python2#        if (byte == '\0'):
+        # if ignore_case = True, lowercase word
         #Python3#
-        if (byte == b'\0'):    
-            # end of current word: read offset and size
-            o = idx_input_file.read(4)
-            oi = int((struct.unpack('>i', o))[0])
-            s = idx_input_file.read(4)
-            si = int((struct.unpack('>i', s))[0])
-
-            # if ignore_case = True, lowercase word
-            #Python3#
-            word = word.decode("utf-8")
-            if ignore_case:
-                word = word.lower()
+        word = word.decode("utf-8")
+        if ignore_case:
+            word = word.lower()
 
-            # extract the proper definition for word
-            # and append it to current data
-            #Python2#            data += [ [word, dict_input[oi:oi+si] ] ]
-            #Python3#
-            defs = dict_input[oi:oi+si].decode("utf-8")
-            #Python3#
-            data += [ [word, defs] ]
+        # yield the location of the definition for word
+        entry = lazyEntry(( word, ), dict_input, offset, size)
+        if position in synonyms:
+            entry.synonyms = synonyms[position]
+        position += 1
+        yield entry
 
-            # reset current word
-            #Python2#            word = ""
-            #Python3#
-            word = b''
-        else:
-            # append current character to current word
-            #Python2#            word += str(byte)
-            #Python3#
-            word += byte
+    unmap_file(idx_input)
+    idx_input_file.close()
+### END read_from_stardict_format ###
 
-        byte = idx_input_file.read(1)
 
-    idx_input_file.close()
-    dict_input_file.close()
+### BEGIN lazyEntry ###
+# lazyEntry(fields, dict_input, offset, size)
+# an entry behaving like the list list(fields) + [ definition ],
+# where definition is stored in dict_input (e.g., a mmap of a .dict file)
+# at the given offset and size, and it is decoded only when accessed
+#
+# e.g., lazyEntry(( word, ), ...) behaves like [ word, definition ]
+#
+# the synonyms attribute holds the synonyms of word read by the reader
+# (e.g., from a StarDict .syn file), and it is not part of the list
+class lazyEntry(object):
+
+    __slots__ = [ 'fields', 'dict_input', 'offset', 'size', 'synonyms' ]
+
+    def __init__(self, fields, dict_input, offset, size):
+        self.fields = fields
+        self.dict_input = dict_input
+        self.offset = offset
+        self.size = size
+        self.synonyms = ()
+
+    # return the definition, reading it from dict_input
+    def definition(self):
+        #Python2#        return str(self.dict_input[self.offset:self.offset+self.size])
+        #Python3#
+        return self.dict_input[self.offset:self.offset+self.size].decode("utf-8")
+
+    # return the undecoded definition, reading it from dict_input
+    def definition_bytes(self):
+        return self.dict_input[self.offset:self.offset+self.size]
+
+    # return the entry as a plain list, decoding the definition
+    def to_list(self):
+        return list(self.fields) + [ self.definition() ]
+
+    def __len__(self):
+        return len(self.fields) + 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.to_list()[i]
+        n = len(self.fields)
+        if (i == n) or (i == -1):
+            return self.definition()
+        if i < 0:
+            i += 1
+        return self.fields[i]
+
+    def __eq__(self, other):
+        return (len(self) == len(other)) and (self.to_list() == list(other))
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return repr(self.to_list())
+### END lazyEntry ###
+
+
+### BEGIN entryStore ###
+# entryStore()
+# a compact list of entries: the UTF-8 bytes of the words and of the definitions
+# are stored one after the other in two bytearrays, with their offsets in two arrays,
+# the include flags are stored in a bitmap (of the excluded entries),
+# and synonyms and substitutions are stored only for the entries having them
+#
+# it behaves like the list of [ word, definition ] returned by the readers,
+# while parsed() behaves like the list of
+# [ word, include, synonyms, substitutions, definition ] returned by the parsers
+# (it is used by the worker processes reading input dictionaries, and by sort_in_memory)
+class entryStore(object):
+
+    def __init__(self):
+        self.words = bytearray()
+        self.word_offsets = offset_array([ 0 ])
+        self.definitions = bytearray()
+        self.definition_offsets = offset_array([ 0 ])
+        self.excluded = bytearray()
+        self.synonyms = dict()
+        self.substitutions = dict()
+        # if not None, the positions of the entries in sorted order
+        self.order = None
+
+    # append an entry, given its word and its definition
+    def append(self, word, definition, include=True, synonyms=None, substitutions=None):
+        #Python2#        definition_bytes = definition
+        #Python3#
+        definition_bytes = definition.encode("utf-8")
+        self.append_undecoded(word, definition_bytes, include, synonyms, substitutions)
 
-    return data
-### END read_from_stardict_format ###
+    # append an entry, given its word and the UTF-8 bytes of its definition
+    def append_undecoded(self, word, definition_bytes, include=True, synonyms=None, substitutions=None):
+        i = len(self)
+        #Python2#        self.words += word
+        #Python3#
+        self.words += word.encode("utf-8")
+        self.word_offsets.append(len(self.words))
+        self.definitions += definition_bytes
+        self.definition_offsets.append(len(self.definitions))
+        if not include:
+            self.set_include(i, False)
+        if synonyms:
+            self.synonyms[i] = list(synonyms)
+        if substitutions:
+            self.substitutions[i] = list(substitutions)
+
+    # append the given [ word, definition ] entries, as returned by a reader
+    def extend(self, entries):
+        for d in entries:
+            if isinstance(d, lazyEntry):
+                # copy the definition without decoding it
+                self.append_undecoded(d[0], d.definition_bytes(), True, d.synonyms)
+            else:
+                self.append(d[0], d[1])
+
+    # append the given parsed entry [ word, include, synonyms, substitutions, definition ],
+    # as returned by the parsers (the definition of a lazyEntry is copied without decoding it)
+    def append_parsed(self, d):
+        if isinstance(d, lazyEntry):
+            self.append_undecoded(d[0], d.definition_bytes(), d[1], d[2], d[3])
+        else:
+            self.append(d[0], d[4], d[1], d[2], d[3])
+
+    # append the entries of the given entryStore
+    def extend_store(self, other):
+        n = len(self)
+        self.words += other.words
+        base = self.word_offsets[-1]
+        self.word_offsets.extend(offset_array([ base + o for o in other.word_offsets[1:] ]))
+        self.definitions += other.definitions
+        base = self.definition_offsets[-1]
+        self.definition_offsets.extend(offset_array([ base + o for o in other.definition_offsets[1:] ]))
+        for i in other.excluded_positions():
+            self.set_include(n + i, False)
+        for i in other.synonyms:
+            self.synonyms[n + i] = other.synonyms[i]
+        for i in other.substitutions:
+            self.substitutions[n + i] = other.substitutions[i]
+
+    # set the include flag of the i-th appended entry
+    def set_include(self, i, include):
+        byte = i >> 3
+        if byte >= len(self.excluded):
+            if include:
+                return
+            self.excluded += bytearray(byte + 1 - len(self.excluded))
+        if include:
+            self.excluded[byte] &= ~(1 << (i & 7))
+        else:
+            self.excluded[byte] |= (1 << (i & 7))
+
+    # return the positions of the excluded entries, in appending order
+    def excluded_positions(self):
+        positions = []
+        for byte in range(len(self.excluded)):
+            if self.excluded[byte] != 0:
+                for bit in range(8):
+                    if (self.excluded[byte] >> bit) & 1:
+                        positions.append((byte << 3) + bit)
+        return positions
+
+    # return the position in appending order of the i-th entry
+    def position(self, i):
+        if i < 0:
+            i += len(self)
+        if self.order != None:
+            return self.order[i]
+        return i
+
+    # return the undecoded word of the entry at the given position
+    def word_bytes(self, p):
+        return self.words[self.word_offsets[p]:self.word_offsets[p+1]]
+
+    # return the word of the entry at the given position
+    def word(self, p):
+        #Python2#        return str(self.word_bytes(p))
+        #Python3#
+        return self.word_bytes(p).decode("utf-8")
+
+    # return the definition of the entry at the given position
+    def definition(self, p):
+        #Python2#        return str(self.definitions[self.definition_offsets[p]:self.definition_offsets[p+1]])
+        #Python3#
+        return self.definitions[self.definition_offsets[p]:self.definition_offsets[p+1]].decode("utf-8")
+
+    # return the include flag of the entry at the given position
+    def include(self, p):
+        byte = p >> 3
+        return (byte >= len(self.excluded)) or (((self.excluded[byte] >> (p & 7)) & 1) == 0)
+
+    # return the entry at the given position, as returned by the readers:
+    # a lazyEntry, carrying its synonyms, whose definition is decoded only if needed
+    def entry(self, p):
+        start = self.definition_offsets[p]
+        d = lazyEntry(( self.word(p), ), self.definitions, start, self.definition_offsets[p+1] - start)
+        if p in self.synonyms:
+            d.synonyms = tuple(self.synonyms[p])
+        return d
+
+    # return the entry at the given position, as returned by the parsers
+    def parsed_entry(self, p):
+        return [ self.word(p),
+                 self.include(p),
+                 list(self.synonyms.get(p, [])),
+                 list(self.substitutions.get(p, [])),
+                 self.definition(p) ]
+
+    # return the function giving the sorting key of the entry at a given position:
+    # its word, or key(word) if key is not None
+    def sort_key(self, key=None):
+        if key == None:
+            # UTF-8 bytes sort like the strings they encode
+            return self.word_bytes
+        return lambda p: key(self.word(p))
+
+    # sort the entries by word, or by key(word) if key is not None,
+    # keeping the appending order of the entries with the same sorting key
+    # if jobs > 1 and key is not None, sort using jobs worker processes (see sort_in_parallel)
+    # if presorted = True, the entries are known to be sorted already
+    #
+    # Note: sorted entries are detected in one pass, and left as they are,
+    # while nearly sorted ones are sorted in about linear time,
+    # since sorted() merges the ascending runs it finds in its input
+    # sorting by word compares byte slices, which is so cheap that
+    # worker processes never make it faster, hence it is always done here
+    def sort(self, key=None, jobs=1, presorted=False):
+        if presorted or self.is_sorted(key):
+            self.order = None
+        elif (jobs > 1) and (key != None) and (len(self) >= PARALLEL_SORT_MIN_ENTRIES):
+            self.order = sort_in_parallel(self, key, jobs)
+        else:
+            order = sorted(range(len(self)), key=self.sort_key(key))
+            self.order = offset_array(order)
+
+    # return True if the entries, in appending order, are sorted by word (or by key(word))
+    def is_sorted(self, key=None):
+        sort_key = self.sort_key(key)
+        return is_sorted(sort_key(p) for p in range(len(self)))
+
+    # return the (first, last) sorting keys of the (non empty) store, in its current order
+    def key_range(self, key=None):
+        sort_key = self.sort_key(key)
+        return (sort_key(self.position(0)), sort_key(self.position(len(self) - 1)))
+
+    # return an entryStore sharing the words of this one, without the definitions
+    # (e.g., to be sent to worker processes, which need the words only)
+    def words_only(self):
+        store = entryStore()
+        store.words = self.words
+        store.word_offsets = self.word_offsets
+        return store
+
+    # return a view of the entries, as returned by the parsers
+    def parsed(self):
+        return parsedEntries(self)
+
+    # return (an estimate of) the number of bytes used by the entries,
+    # including the temporary objects needed to sort them
+    def memory_usage(self):
+        return 2 * len(self.words) + len(self.definitions) + 128 * len(self)
+
+    def __len__(self):
+        return len(self.word_offsets) - 1
+
+    def __getitem__(self, i):
+        return self.entry(self.position(i))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.entry(self.position(i))
+### END entryStore ###
+
+
+### BEGIN parsedEntries ###
+# parsedEntries(store)
+# a view of the given entryStore, behaving like the list of
+# [ word, include, synonyms, substitutions, definition ] returned by the parsers
+class parsedEntries(object):
+
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, i):
+        return self.store.parsed_entry(self.store.position(i))
+
+    def __iter__(self):
+        for i in range(len(self.store)):
+            yield self.store.parsed_entry(self.store.position(i))
+### END parsedEntries ###
+
+
+### BEGIN read_stardict_index ###
+# read_stardict_index(idx_input, record_format='>II')
+# parse the given StarDict index (a string or a mmap of the .idx file)
+# and yield a ( word, offset, size ) triple for each record,
+# where word is the undecoded byte string of the headword
+#
+# record_format is the struct format of the fields following the headword:
+# '>II' for .idx files (offset, size), '>QI' for .idx files with 64 bit offsets,
+# and '>I' for .syn files (entry index)
+#
+# Note: the headwords are located by searching for their NUL terminators,
+# and the other fields are unpacked directly from idx_input,
+# so that no per-byte work is done in Python
+def read_stardict_index(idx_input, record_format='>II'):
+    #Python2#    nul = '\0'
+    #Python3#
+    nul = b'\0'
+    find = idx_input.find
+    record = struct.Struct(record_format)
+    unpack_from = record.unpack_from
+    record_size = record.size
+    length = len(idx_input)
+    pos = 0
+    while pos < length:
+        nul_pos = find(nul, pos)
+        if (nul_pos < 0) or (nul_pos + 1 + record_size > length):
+            # truncated record at the end of the index
+            break
+        yield (idx_input[pos:nul_pos], ) + unpack_from(idx_input, nul_pos + 1)
+        pos = nul_pos + 1 + record_size
+### END read_stardict_index ###
+
+
+### BEGIN read_stardict_index_stream ###
+# read_stardict_index_stream(idx_input_file, record_format='>II', chunk_size=1048576)
+# parse the StarDict index read from the given file object
+# (e.g., a gzip file) in chunks of chunk_size bytes,
+# and yield a ( word, offset, size ) triple for each record,
+# like read_stardict_index
+def read_stardict_index_stream(idx_input_file, record_format='>II', chunk_size=1048576):
+    record_size = struct.calcsize(record_format)
+    buffer = b''
+    chunk = idx_input_file.read(chunk_size)
+    while chunk:
+        buffer += chunk
+        # parse the complete records in buffer,
+        # and keep the last, incomplete one (if any) for the next chunk
+        consumed = 0
+        for record in read_stardict_index(buffer, record_format):
+            consumed += len(record[0]) + 1 + record_size
+            yield record
+        buffer = buffer[consumed:]
+        chunk = idx_input_file.read(chunk_size)
+### END read_stardict_index_stream ###
+
+
+### BEGIN offset_array ###
+# offset_array(values=())
+# return an array of unsigned 64 bit integers (offsets or positions)
+# holding the given values, or a list if there is no such array typecode
+def offset_array(values=()):
+    if OFFSET_TYPECODE == None:
+        return list(values)
+    return array.array(OFFSET_TYPECODE, values)
+### END offset_array ###
+
+
+### BEGIN map_file ###
+# map_file(input_file)
+# map the given file (opened in binary mode) in memory, read-only
+# empty files cannot be mapped, hence an empty string is returned for them
+def map_file(input_file):
+    if os.fstat(input_file.fileno()).st_size == 0:
+        #Python2#        return ""
+        #Python3#
+        return b''
+    return mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+### END map_file ###
+
+
+### BEGIN unmap_file ###
+# unmap_file(mapped)
+# release a buffer returned by map_file
+def unmap_file(mapped):
+    if isinstance(mapped, mmap.mmap):
+        mapped.close()
+### END unmap_file ###
+
+
+### BEGIN split_file ###
+# split_file(input_filename, separator, parts, after_separator, min_range_size=1048576)
+# split the given file into at most parts byte ranges of similar size
+# (but at least min_range_size bytes long), and return them as (start, end) pairs
+# each range but the first starts at an occurrence of separator,
+# or right after it if after_separator = True
+def split_file(input_filename, separator, parts, after_separator, min_range_size=1048576):
+    size = os.path.getsize(input_filename)
+    parts = max(1, min(parts, size // min_range_size))
+    starts = [ 0 ]
+    input_file = open(input_filename, "rb")
+    for i in range(1, parts):
+        pos = find_in_file(input_file, separator, max(size * i // parts, starts[-1]))
+        if pos < 0:
+            break
+        if after_separator:
+            pos += len(separator)
+        if (pos > starts[-1]) and (pos < size):
+            starts.append(pos)
+    input_file.close()
+    return list(zip(starts, starts[1:] + [ size ]))
+### END split_file ###
+
+
+### BEGIN find_in_file ###
+# find_in_file(input_file, separator, pos, block_size=65536)
+# return the offset of the first occurrence of separator
+# in the given file (opened in binary mode) at or after pos, or -1 if there is none
+def find_in_file(input_file, separator, pos, block_size=65536):
+    input_file.seek(pos)
+    buffer = b''
+    while True:
+        block = input_file.read(block_size)
+        if len(block) == 0:
+            return -1
+        buffer += block
+        i = buffer.find(separator)
+        if i > -1:
+            return pos + i
+        # keep the tail of the buffer, which might be the beginning of separator
+        drop = max(0, len(buffer) - len(separator) + 1)
+        pos += drop
+        buffer = buffer[drop:]
+### END find_in_file ###
+
+
+### BEGIN fileRange ###
+# fileRange(input_file, start, end)
+# a read-only view of the byte range [start, end) of the given file
+# (opened in binary mode), which looks like a file ending at end
+class fileRange(object):
+
+    def __init__(self, input_file, start, end):
+        self.input_file = input_file
+        self.input_file.seek(start)
+        self.remaining = end - start
+
+    def read(self, size=-1):
+        if (size < 0) or (size > self.remaining):
+            size = self.remaining
+        chunk = self.input_file.read(size)
+        self.remaining -= len(chunk)
+        return chunk
+### END fileRange ###
+
+
+### BEGIN read_in_parallel ###
+# read_in_parallel(function, tasks, jobs)
+# call function on each of the given tasks using jobs worker processes,
+# and yield the items of the returned lists, in the order of the tasks
+def read_in_parallel(function, tasks, jobs):
+    pool = multiprocessing.Pool(jobs)
+    for result in pool.imap(function, tasks):
+        for item in result:
+            yield item
+    pool.close()
+    pool.join()
+### END read_in_parallel ###
+
+
+### BEGIN dictzipFile ###
+# dictzipFile(dictzip_filename, cache_size=64)
+# random-access reader for a dictzip (e.g., .dict.dz) file,
+# behaving like a read-only byte string containing the uncompressed data:
+# slicing it, e.g. dictzip_file[offset:offset+size],
+# decompresses only the chunks holding the requested bytes
+#
+# the chunk table is read from the "RA" subfield of the gzip extra field,
+# and the last cache_size decompressed chunks are kept in memory
+# (a plain gzip file, with no chunk table, is decompressed in memory at once)
+class dictzipFile(object):
+
+    def __init__(self, dictzip_filename, cache_size=64):
+        self.dictzip_filename = dictzip_filename
+        dictzip_file = open(dictzip_filename, "rb")
+        self.compressed = map_file(dictzip_file)
+        dictzip_file.close()
+        self.cache = collections.OrderedDict()
+        self.cache_size = cache_size
+        self.last_index = -1
+        self.last_chunk = None
+        self.chunk_length = 0
+        self.chunk_offsets = []
+        self.uncompressed = None
+        self.size = 0
+        self.read_header()
+
+    # parse the gzip header, and build the chunk table
+    def read_header(self):
+        c = self.compressed
+        if (len(c) < 18) or (c[0:2] != b'\x1f\x8b') or (ord(c[2:3]) != 8):
+            raise IOError("File " + self.dictzip_filename + " is not a gzip file.")
+        flags = ord(c[3:4])
+        pos = 10
+        chunk_sizes = None
+
+        # FEXTRA: look for the RA subfield
+        if flags & 4:
+            extra_length = struct.unpack_from('<H', c, pos)[0]
+            pos += 2
+            extra_end = pos + extra_length
+            while pos + 4 <= extra_end:
+                subfield_id = c[pos:pos+2]
+                subfield_length = struct.unpack_from('<H', c, pos + 2)[0]
+                if subfield_id == b'RA':
+                    version, chunk_length, chunk_count = struct.unpack_from('<HHH', c, pos + 4)
+                    chunk_sizes = struct.unpack_from('<' + 'H' * chunk_count, c, pos + 10)
+                    self.chunk_length = chunk_length
+                pos += 4 + subfield_length
+            pos = extra_end
+
+        # FNAME and FCOMMENT: skip NUL-terminated strings
+        if flags & 8:
+            pos = c.find(b'\0', pos) + 1
+        if flags & 16:
+            pos = c.find(b'\0', pos) + 1
+
+        # FHCRC: skip header CRC
+        if flags & 2:
+            pos += 2
+
+        if chunk_sizes == None:
+            # no chunk table: decompress everything
+            self.uncompressed = zlib.decompressobj(-15).decompress(c[pos:])
+            self.size = len(self.uncompressed)
+        else:
+            for chunk_size in chunk_sizes:
+                self.chunk_offsets.append(pos)
+                pos += chunk_size
+            self.chunk_offsets.append(pos)
+            # ISIZE field of the gzip trailer
+            self.size = struct.unpack_from('<I', c, len(c) - 4)[0]
+
+    # decompress the i-th chunk
+    def decompress_chunk(self, i):
+        start = self.chunk_offsets[i]
+        end = self.chunk_offsets[i + 1]
+        return zlib.decompressobj(-15).decompress(self.compressed[start:end])
+
+    # return the i-th chunk, from the cache if possible
+    def get_chunk(self, i):
+        if i == self.last_index:
+            # sequential access hits the same chunk many times in a row
+            return self.last_chunk
+        if i in self.cache:
+            chunk = self.cache.pop(i)
+        else:
+            chunk = self.decompress_chunk(i)
+            if len(self.cache) >= self.cache_size:
+                self.cache.popitem(last=False)
+        self.cache[i] = chunk
+        self.last_index = i
+        self.last_chunk = chunk
+        return chunk
+
+    # return the uncompressed bytes in [start, stop),
+    # with 0 <= start <= stop <= size
+    def read_range(self, start, stop):
+        if self.uncompressed != None:
+            return self.uncompressed[start:stop]
+        if start == stop:
+            return b''
+        first = start // self.chunk_length
+        last = (stop - 1) // self.chunk_length
+        base = first * self.chunk_length
+        if first == last:
+            # most requests fall within a single chunk: avoid copying it
+            return self.get_chunk(first)[start - base:stop - base]
+        data = b''.join([ self.get_chunk(i) for i in range(first, last + 1) ])
+        return data[start - base:stop - base]
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if not isinstance(i, slice):
+            raise TypeError("dictzipFile supports slicing only")
+        start, stop, step = i.indices(self.size)
+        return self.read_range(start, stop)
+
+    def close(self):
+        self.cache.clear()
+        self.last_chunk = None
+        unmap_file(self.compressed)
+### END dictzipFile ###
 
 
 ### BEGIN read_from_xml_format ###
-# read_from_xml_format(xml_input_filename, ignore_case)
+# read_from_xml_format(xml_input_filename, ignore_case, jobs)
 # read data from the given XML dictionary
-# and return a list of [ [word, definition] ]
+# and yield its [word, definition] pairs, one at a time
 # if ignore_case = True, lowercase all the index word
-def read_from_xml_format(xml_input_filename, ignore_case):
-
-    data = []
+# if jobs > 1, parse byte ranges of the file using jobs worker processes
+#
+# Note: the file is scanned in chunks, and each entry is discarded
+# as soon as it has been parsed, hence memory usage does not depend
+# on the size of the file. The scan is lenient, like a plain text search:
+# an unescaped & or < in a key or in a definition is kept as it is
+def read_from_xml_format(xml_input_filename, ignore_case, jobs):
+
+    if jobs > 1:
+        # ranges start at an <entry> tag, so that no entry is split
+        # (unless a CDATA section contains a literal <entry> tag)
+        ranges = split_file(xml_input_filename, b'<entry>', jobs * 4, False)
+        if len(ranges) > 1:
+            tasks = [ (xml_input_filename, start, end, ignore_case) for (start, end) in ranges ]
+            for d in read_in_parallel(read_xml_range, tasks, jobs):
+                yield d
+            return
 
     # open file
-    #Python2#    xml_input_file = open(xml_input_filename, "rb")
-    #Python3#
-    xml_input_file = open(xml_input_filename, "r")
+    xml_input_file = open(xml_input_filename, "rb")
 
-    # read the whole dictionary in memory
-    xml_input = xml_input_file.read()
-
-    entry_pos = 0
-    entry_pos = xml_input.find('<entry>', entry_pos)
-    while entry_pos > -1:
-        pos = xml_input.find('<key>', entry_pos)
-        end_pos = xml_input.find('</key>', pos)
-        key = xml_input[pos + len('<key>'): end_pos].strip()
+    for entry in read_xml_entries(xml_input_file):
+        key, definition = parse_xml_entry(entry)
 
         if ignore_case:
             key = key.lower()
 
-        pos = xml_input.find('<def>', entry_pos)
-        end_pos = xml_input.find('</def>', pos)
-        definition = xml_input[pos + len('<def>'): end_pos].strip()
+        yield [ key, definition ]
+
+    xml_input_file.close()
+### END read_from_xml_format ###
+
 
-        data += [ [ xml.sax.saxutils.unescape(key), xml.sax.saxutils.unescape(definition) ] ]
+### BEGIN read_xml_range ###
+# read_xml_range(task)
+# read the entries in the byte range [start, end) of the XML dictionary,
+# where task = (xml_input_filename, start, end, ignore_case),
+# and return the list of their [word, definition] pairs
+# (run by the worker processes of read_from_xml_format)
+def read_xml_range(task):
+    xml_input_filename, start, end, ignore_case = task
 
-        entry_pos = xml_input.find('<entry>', entry_pos + 1)
+    data = []
+    xml_input_file = open(xml_input_filename, "rb")
+    for entry in read_xml_entries(fileRange(xml_input_file, start, end)):
+        key, definition = parse_xml_entry(entry)
 
+        if ignore_case:
+            key = key.lower()
+
+        data.append([ key, definition ])
     xml_input_file.close()
 
     return data
-### END read_from_xml_format ###
+### END read_xml_range ###
+
+
+### BEGIN read_xml_entries ###
+# read_xml_entries(xml_input_file, chunk_size=1048576)
+# read the given XML file (opened in binary mode) in chunks of chunk_size bytes
+# and yield the (undecoded) text of each <entry>...</entry> element,
+# without the closing tag
+def read_xml_entries(xml_input_file, chunk_size=1048576):
+    buffer = b''
+    pos = 0
+    eof = False
+    while True:
+        start = buffer.find(b'<entry>', pos)
+        if start > -1:
+            end = find_outside_cdata(buffer, b'</entry>', start)
+            if end > -1:
+                yield buffer[start:end]
+                pos = end + len('</entry>')
+                continue
+            if eof:
+                # unterminated entry at the end of the file
+                yield buffer[start:]
+                break
+        elif eof:
+            break
+
+        # read the next chunk, discarding what has been already parsed
+        # (but keeping a partial <entry> tag at the end of the buffer)
+        if start < 0:
+            start = max(pos, len(buffer) - len('<entry>'))
+        chunk = xml_input_file.read(chunk_size)
+        eof = (len(chunk) == 0)
+        buffer = buffer[start:] + chunk
+        pos = 0
+### END read_xml_entries ###
+
+
+### BEGIN find_outside_cdata ###
+# find_outside_cdata(buffer, tag, pos)
+# return the position of the first occurrence of tag in buffer,
+# starting from pos and skipping CDATA sections,
+# or -1 if tag does not occur (or a CDATA section is not terminated)
+def find_outside_cdata(buffer, tag, pos):
+    while True:
+        tag_pos = buffer.find(tag, pos)
+        if tag_pos < 0:
+            return -1
+        cdata_pos = buffer.find(b'<![CDATA[', pos, tag_pos)
+        if cdata_pos < 0:
+            return tag_pos
+        cdata_end = buffer.find(b']]>', cdata_pos)
+        if cdata_end < 0:
+            return -1
+        pos = cdata_end + len(']]>')
+### END find_outside_cdata ###
+
+
+### BEGIN parse_xml_entry ###
+# parse_xml_entry(entry)
+# return the [key, definition] pair contained in the given
+# (undecoded) text of an XML entry, unescaping them
+XML_ENTRY_TAGS = [ (b'<key>', b'</key>'), (b'<def>', b'</def>') ]
+def parse_xml_entry(entry):
+    has_cdata = (entry.find(b'<![CDATA[') > -1)
+    values = []
+    for open_tag, close_tag in XML_ENTRY_TAGS:
+        value = b''
+        pos = entry.find(open_tag)
+        if pos > -1:
+            pos += len(open_tag)
+            if has_cdata:
+                end_pos = find_outside_cdata(entry, close_tag, pos)
+            else:
+                end_pos = entry.find(close_tag, pos)
+            if end_pos < 0:
+                end_pos = len(entry)
+            value = entry[pos:end_pos].strip()
+        #Python3#
+        value = value.decode("utf-8")
+        values.append(unescape_xml(value))
+    return values
+### END parse_xml_entry ###
+
+
+### BEGIN unescape_xml ###
+# unescape_xml(s)
+# unescape the given XML text: the content of CDATA sections is kept as it is,
+# while outside them the predefined and the numeric character entities are replaced
+def unescape_xml(s):
+    if s.find('<![CDATA[') < 0:
+        return unescape_xml_entities(s)
+
+    unescaped = []
+    pos = 0
+    while True:
+        start = s.find('<![CDATA[', pos)
+        if start < 0:
+            unescaped.append(unescape_xml_entities(s[pos:]))
+            break
+        end = s.find(']]>', start)
+        if end < 0:
+            end = len(s)
+        unescaped.append(unescape_xml_entities(s[pos:start]))
+        unescaped.append(s[start + len('<![CDATA['):end])
+        pos = end + len(']]>')
+    return ''.join(unescaped)
+### END unescape_xml ###
+
+
+### BEGIN unescape_xml_entities ###
+# unescape_xml_entities(s)
+# replace the predefined and the numeric character entities in s
+# (&amp; is replaced last, as in xml.sax.saxutils.unescape)
+XML_NUMERIC_ENTITY = re.compile(r'&#(x[0-9a-fA-F]+|[0-9]+);')
+def unescape_xml_entities(s):
+    if s.find('&') < 0:
+        return s
+    if s.find('&#') > -1:
+        s = XML_NUMERIC_ENTITY.sub(unescape_xml_numeric_entity, s)
+    s = s.replace("&lt;", "<").replace("&gt;", ">").replace("&quot;", '"').replace("&apos;", "'")
+    return s.replace("&amp;", "&")
+### END unescape_xml_entities ###
+
+
+### BEGIN unescape_xml_numeric_entity ###
+# unescape_xml_numeric_entity(match)
+# return the character referenced by the matched numeric entity
+def unescape_xml_numeric_entity(match):
+    code = match.group(1)
+    if code.startswith('x'):
+        code = int(code[1:], 16)
+    else:
+        code = int(code)
+    try:
+        #Python2#        return unichr(code).encode("utf-8")
+        #Python3#
+        return chr(code)
+    except (ValueError, OverflowError):
+        # not a valid character: keep the entity as it is
+        return match.group(0)
+### END unescape_xml_numeric_entity ###
 
 
 ### BEGIN read_from_odyssey_format ###
 # read_from_odyssey_format(idx_input_filename,
 #   dict_input_filename, ignore_case)
 # read data from the given odyssey dictionary
-# and return a list of [ [word, definition] ]
+# and yield its [word, definition] pairs, one at a time
 # if ignore_case = True, lowercase all the index word
+#
+# Note: the c_N chunks are read from the dictionary zip file in memory,
+# one at a time, following the index in (chunk, offset) order
 def read_from_odyssey_format(idx_input_filename, dict_input_filename, ignore_case):
 
-    data = []
-
-    # unzip dictionary
-    extractedFiles = unzip(dict_input_filename)
+    # open dictionary
+    dict_input = zipfile.ZipFile(dict_input_filename)
 
     # open index
     sql_connection = sqlite3.connect(idx_input_filename)
+    sql_connection.text_factory = str
     
     # get a cursor
     sql_cursor = sql_connection.cursor()
-    # get the index data
-    sql_cursor.execute('select * from T_DictIndex ')
-    index_data = sql_cursor.fetchall()
+    # iterate over the index data, without loading it all in memory
+    sql_cursor.execute('select F_Word, F_Offset, F_Size, F_ChunckNum from T_DictIndex order by F_ChunckNum, F_Offset')
 
-    # dictionary from file to words
-    words = collections.defaultdict(list)
+    chunk_number = None
+    chunk = b''
+    for (key, offset, length, current_chunk_number) in sql_cursor:
+        if current_chunk_number != chunk_number:
+            # the previous chunk is not needed anymore
+            chunk_number = current_chunk_number
+            chunk = dict_input.read("c_" + str(chunk_number))
 
-    # process index
-    for tuple in index_data:
-        key = tuple[1]
         if ignore_case:
             key = key.lower()
-        offset = tuple[2]
-        length = tuple[3]
-        cNumber = tuple[4]
-        words[cNumber].append([key, offset, length])
-
-    cNumberMax = len(words.keys())
-    for i in range(1, cNumberMax+1):
-        f = open("c_" + str(i), "rb")
-        for tuple in words[i]:
-            definition = ""
-            key = tuple[0]
-            offset = tuple[1]
-            length = tuple[2]
-            f.seek(offset)
-            definition = f.read(length)
-            #Python2#            data += [ [key, definition] ]
-            #Python3#
-            data += [ [key, definition.decode("utf-8")] ]
-        f.close()
+
+        definition = chunk[offset:offset+length]
+        #Python2#        yield [key, definition]
+        #Python3#
+        yield [key, definition.decode("utf-8")]
 
     sql_cursor.close()
     sql_connection.close()
-
-    for e in extractedFiles:
-        os.remove(e)
-
-    return data
+    dict_input.close()
 ### END read_from_odyssey_format ###
 
 
-### BEGIN unzip ###
-# unzip(zip_filename)
-# unzip the give zip_filename
-# returning the list of extracted files
-def unzip(zip_filename):
-    extractedFiles = []
-    zfile = zipfile.ZipFile(zip_filename)
-    for name in zfile.namelist():
-        (dirname, filename) = os.path.split(name)
-        if (len(dirname) > 0 and not os.path.exists(dirname)):
-            os.mkdir(dirname)
-        fd = open(name,"wb")
-        fd.write(zfile.read(name))
-        fd.close()
-        extractedFiles += [ name ]
-    return extractedFiles
-### END unzip ###
+### BEGIN read_odyssey_words ###
+# read_odyssey_words(idx_input_filename, ignore_case)
+# yield the words of the given odyssey index, one at a time,
+# in the same order as read_from_odyssey_format does
+def read_odyssey_words(idx_input_filename, ignore_case):
+    sql_connection = sqlite3.connect(idx_input_filename)
+    sql_connection.text_factory = str
+    sql_cursor = sql_connection.cursor()
+    sql_cursor.execute('select F_Word from T_DictIndex order by F_ChunckNum, F_Offset')
+    for (key, ) in sql_cursor:
+        if ignore_case:
+            key = key.lower()
+        yield key
+    sql_cursor.close()
+    sql_connection.close()
+### END read_odyssey_words ###
 
 
 ### BEGIN read_from_kobo_format ###
-# read_from_kobo_format(kobo_input_filename, ignore_case)
+# read_from_kobo_format(kobo_input_filename, ignore_case, jobs)
 # read data from the given Kobo dictionary
 # and return a list of [ [word, definition] ]
 # if ignore_case = True, lowercase all the index word
-def read_from_kobo_format(kobo_input_filename, ignore_case):
+# if jobs > 1, decompress the XX.html files using jobs threads
+def read_from_kobo_format(kobo_input_filename, ignore_case, jobs):
 
     data = []
-    
-    # extract words file
-    words_filename = "words"
-    zfile = zipfile.ZipFile(kobo_input_filename)
-    fd = open(words_filename,"wb")
-    fd.write(zfile.read(words_filename))
-    fd.close()
-    
-    # FIXME is there a better way to extract all the words from a MARISA trie?
-    ids = ""
-    for i in range(1000000):
-        ids += str(i) + "\n"
-    #Python3#
-    ids = bytearray(ids, "utf-8")
 
-    p = subprocess.Popen([MARISA_REVERSE_LOOKUP_PATH, words_filename], stdout=subprocess.PIPE, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
-    #Python2#    stdout = p.communicate(input=ids)[0]
-    #Python3#
-    stdout = p.communicate(input=ids)[0].decode("utf-8")    
+    zfile = zipfile.ZipFile(kobo_input_filename)
 
-    for s in stdout.splitlines():
-        x = s.split("\t")
-        if len(x) > 1:
-            key = x[1]
+    # read the definitions from the XX.html files
+    html_filenames = [ name for name in zfile.namelist() if name.endswith(".html") ]
+    for html in read_kobo_html_files(zfile, html_filenames, jobs):
+        for (key, definition) in read_kobo_html_entries(html):
+            #Python3#
+            key = key.decode("utf-8")
+            #Python3#
+            definition = definition.decode("utf-8")
             if ignore_case:
                 key = key.lower()
-            # just return the index, since content might be encrypted
             if (len(key) > 0):
-                data += [ [key, ""] ]
+                data += [ [key, definition] ]
+
+    if len(data) > 0:
+        zfile.close()
+        return data
 
-    # unzip dictionary
-    os.remove(words_filename)
+    # the content is encrypted, hence read the words file only
+    print_info("No definitions found in " + kobo_input_filename + ", reading the index only...")
+    words = zfile.read("words")
+    zfile.close()
+
+    for key in read_marisa_keys(words):
+        if ignore_case:
+            key = key.lower()
+        # just return the index, since content might be encrypted
+        if (len(key) > 0):
+            data += [ [key, ""] ]
 
     return data
 ### END read_from_kobo_format ###
 
 
+### BEGIN read_kobo_html_files ###
+# read_kobo_html_files(zfile, html_filenames, jobs)
+# yield the uncompressed contents of the given XX.html files
+# of the given Kobo zip file, in the given order
+# if jobs > 1, decompress them using jobs threads (zlib releases the GIL)
+def read_kobo_html_files(zfile, html_filenames, jobs):
+    compressed = (zfile.read(name) for name in html_filenames)
+    if jobs > 1:
+        pool = multiprocessing.pool.ThreadPool(jobs)
+        for html in pool.imap(gunzip_kobo_html, compressed):
+            yield html
+        pool.close()
+        pool.join()
+    else:
+        for c in compressed:
+            yield gunzip_kobo_html(c)
+### END read_kobo_html_files ###
+
+
+### BEGIN gunzip_kobo_html ###
+# gunzip_kobo_html(compressed)
+# decompress the given XX.html file, if it is gzipped,
+# returning an empty string if it cannot be decompressed (e.g., it is encrypted)
+def gunzip_kobo_html(compressed):
+    if not compressed.startswith(b'\x1f\x8b'):
+        return compressed
+    try:
+        return zlib.decompress(compressed, 16 + zlib.MAX_WBITS)
+    except zlib.error:
+        return b''
+### END gunzip_kobo_html ###
+
+
+### BEGIN read_kobo_html_entries ###
+# read_kobo_html_entries(html)
+# scan the given (uncompressed) XX.html file once,
+# and yield the (undecoded) (word, definition) pairs of its <w> blocks,
+# which look like <w><a name="word"/><div>definition</div></w>
+# the <b>word</b><br/> heading written by write_to_kobo_format
+# is removed from the definition
+def read_kobo_html_entries(html):
+    pos = 0
+    while True:
+        start = html.find(b'<w>', pos)
+        if start < 0:
+            break
+        end = html.find(b'</w>', start)
+        if end < 0:
+            end = len(html)
+        pos = end + len(b'</w>')
+
+        # word
+        name = html.find(b'name="', start, end)
+        if name < 0:
+            continue
+        name += len(b'name="')
+        name_end = html.find(b'"', name, end)
+        if name_end < 0:
+            continue
+        word = html[name:name_end]
+
+        # definition
+        definition = b''
+        div = html.find(b'<div>', name_end, end)
+        if div > -1:
+            div += len(b'<div>')
+            div_end = html.rfind(b'</div>', div, end)
+            if div_end < 0:
+                div_end = end
+            definition = html[div:div_end]
+            heading = b'<b>' + word + b'</b><br/>'
+            if definition.startswith(heading):
+                definition = definition[len(heading):]
+
+        yield (word, definition)
+### END read_kobo_html_entries ###
+
+
+### BEGIN read_marisa_keys ###
+# read_marisa_keys(trie)
+# return the list of all the keys of the given MARISA trie (a byte string),
+# using the marisa_trie module if it is available,
+# otherwise running a predictive search for the empty string,
+# which matches every key, with marisa-predictive-search
+def read_marisa_keys(trie):
+    if marisa_trie != None:
+        keys = marisa_trie.Trie().frombytes(trie).keys()
+        #Python2#        keys = [ k.encode("utf-8") for k in keys ]
+        return keys
+
+    # the executable reads the trie from a file
+    trie_filename = "words"
+    f = open(trie_filename, "wb")
+    f.write(trie)
+    f.close()
+
+    # -n 0 means no limit on the number of results
+    p = subprocess.Popen([MARISA_PREDICTIVE_SEARCH_PATH, "-n", "0", trie_filename], stdout=subprocess.PIPE, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout = p.communicate(input=b'\n')[0]
+    os.remove(trie_filename)
+
+    # each result is printed as "id<TAB>key<TAB>query", and query is empty
+    # (do not use splitlines(), as keys might contain other line breaks)
+    keys = []
+    for s in stdout.split(b'\n'):
+        x = s.split(b'\t')
+        if len(x) > 2:
+            key = b'\t'.join(x[1:-1])
+            #Python3#
+            key = key.decode("utf-8")
+            keys.append(key)
+    return keys
+### END read_marisa_keys ###
+
+
 ### BEGIN read_from_csv_format ###
-# read_from_csv_format(csv_input_filename, fs, ls, ignore_case)
+# read_from_csv_format(csv_input_filename, fs, ls, quote, ignore_case, jobs)
 # read data from the given CSV dictionary
-# and return a list of [ [word, definition] ]
+# and yield its [word, definition] pairs, one at a time
+# if quote is not None, fields might be quoted (see read_quoted_csv_records)
 # if ignore_case = True, lowercase all the index word
-def read_from_csv_format(csv_input_filename, fs, ls, ignore_case):
-
-    data = []
+# if jobs > 1, parse byte ranges of the file using jobs worker processes
+def read_from_csv_format(csv_input_filename, fs, ls, quote, ignore_case, jobs):
+
+    # a range might start inside a quoted field, hence quoted CSV is read sequentially
+    if (jobs > 1) and (quote == None):
+        # ranges start right after a line separator
+        ranges = split_file(csv_input_filename, bytearray(ls, "utf-8"), jobs * 4, True)
+        if len(ranges) > 1:
+            tasks = [ (csv_input_filename, start, end, fs, ls, ignore_case) for (start, end) in ranges ]
+            for d in read_in_parallel(read_csv_range, tasks, jobs):
+                yield d
+            return
 
     # open file
-    #Python2#    csv_input_file = open(csv_input_filename, "rb")
-    #Python3#
-    csv_input_file = open(csv_input_filename, "r") 
-    csv_input = csv_input_file.read()
+    csv_input_file = open(csv_input_filename, "rb")
+
+    for d in read_csv_entries(csv_input_file, fs, ls, quote, ignore_case):
+        yield d
+
     csv_input_file.close()
+### END read_from_csv_format ###
+
+
+### BEGIN read_csv_range ###
+# read_csv_range(task)
+# read the lines in the byte range [start, end) of the CSV dictionary,
+# where task = (csv_input_filename, start, end, fs, ls, ignore_case),
+# and return the list of their [word, definition] pairs
+# (run by the worker processes of read_from_csv_format)
+def read_csv_range(task):
+    csv_input_filename, start, end, fs, ls, ignore_case = task
 
-    # read the whole dictionary in memory
-    for line in csv_input.split(ls):
-        lvals = line.split(fs)
+    csv_input_file = open(csv_input_filename, "rb")
+    data = list(read_csv_entries(fileRange(csv_input_file, start, end), fs, ls, None, ignore_case))
+    csv_input_file.close()
+
+    return data
+### END read_csv_range ###
 
+
+### BEGIN read_csv_entries ###
+# read_csv_entries(csv_input_file, fs, ls, quote, ignore_case)
+# read the given CSV file (opened in binary mode)
+# and yield the [word, definition] pairs of its lines
+def read_csv_entries(csv_input_file, fs, ls, quote, ignore_case):
+    if quote == None:
+        records = read_csv_records(csv_input_file, fs, ls)
+    else:
+        records = read_quoted_csv_records(csv_input_file, fs, ls, quote)
+
+    for lvals in records:
         # grab the first two fields, ignore subsequent ones (if any)
         if len(lvals) >= 2:
             key = lvals[0]
@@ -335,15 +1930,159 @@ def read_from_csv_format(csv_input_filename, fs, ls, ignore_case):
             if ignore_case:
                 key = key.lower()
 
-            data += [ [ key, definition ] ]
+            yield [ key, definition ]
+### END read_csv_entries ###
+
+
+### BEGIN read_csv_records ###
+# read_csv_records(csv_input_file, fs, ls, chunk_size=1048576)
+# read the given CSV file (opened in binary mode) in chunks of chunk_size bytes
+# and yield the list of the fields of each line
+# fs and ls might be longer than one character, and they might span two chunks
+# if ls is "\n", a "\r\n" line separator is accepted as well
+def read_csv_records(csv_input_file, fs, ls, chunk_size=1048576):
+    ls_bytes = bytearray(ls, "utf-8")
+    crlf = (ls == "\n")
+    buffer = b''
+    while True:
+        chunk = csv_input_file.read(chunk_size)
+        if len(chunk) == 0:
+            if len(buffer) == 0:
+                break
+            # the last line is not terminated by ls
+            end = len(buffer)
+        else:
+            buffer += chunk
+            end = buffer.rfind(ls_bytes)
+            if end < 0:
+                continue
+            end += len(ls_bytes)
+
+        # split the complete lines, keeping the rest of the buffer
+        text = buffer[:end]
+        buffer = buffer[end:]
+        #Python3#
+        text = text.decode("utf-8")
+        if crlf:
+            text = text.replace("\r\n", "\n")
+        lines = text.split(ls)
+        if len(chunk) > 0:
+            # text ends with ls, hence the last item is usually empty,
+            # unless ls overlaps with itself (e.g., "abab" in "ababab")
+            rest = lines.pop()
+            if len(rest) > 0:
+                #Python3#
+                rest = rest.encode("utf-8")
+                buffer = rest + buffer
+        for line in lines:
+            yield line.split(fs)
+
+        if len(chunk) == 0:
+            break
+### END read_csv_records ###
+
+
+### BEGIN read_quoted_csv_records ###
+# read_quoted_csv_records(csv_input_file, fs, ls, quote, chunk_size=1048576)
+# like read_csv_records, but a field starting with quote is a quoted field,
+# which ends at the next quote not followed by another quote,
+# and which might contain fs and ls; inside it, a doubled quote stands for a quote
+def read_quoted_csv_records(csv_input_file, fs, ls, quote, chunk_size=1048576):
+    crlf = (ls == "\n")
+    #Python3#
+    fs = fs.encode("utf-8")
+    #Python3#
+    ls = ls.encode("utf-8")
+    #Python3#
+    quote = quote.encode("utf-8")
+    buffer = b''
+    pos = 0
+    eof = False
+    while (pos < len(buffer)) or (not eof):
+        parsed = parse_quoted_csv_record(buffer, pos, fs, ls, quote, crlf, eof)
+        if parsed == None:
+            # the record might continue in the next chunk
+            chunk = csv_input_file.read(chunk_size)
+            eof = (len(chunk) == 0)
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+
+        fields, pos = parsed
+        #Python3#
+        fields = [ f.decode("utf-8") for f in fields ]
+        yield fields
+### END read_quoted_csv_records ###
+
+
+### BEGIN parse_quoted_csv_record ###
+# parse_quoted_csv_record(buffer, pos, fs, ls, quote, crlf, eof)
+# parse the CSV record starting at pos in buffer,
+# and return (fields, position of the next record),
+# or None if the end of the record is not in buffer yet (and eof = False)
+# text following the closing quote of a quoted field is appended to the field
+def parse_quoted_csv_record(buffer, pos, fs, ls, quote, crlf, eof):
+    separator_length = max(len(fs), len(ls))
+    fields = []
+    while True:
+        field = b''
+
+        if buffer.startswith(quote, pos):
+            # quoted field
+            start = pos + len(quote)
+            while True:
+                end = buffer.find(quote, start)
+                if end < 0:
+                    if not eof:
+                        return None
+                    # unterminated quoted field at the end of the file
+                    field += buffer[start:]
+                    pos = len(buffer)
+                    break
+                field += buffer[start:end]
+                pos = end + len(quote)
+                if (not eof) and (pos + len(quote) > len(buffer)):
+                    # cannot tell whether the quote is doubled
+                    return None
+                if not buffer.startswith(quote, pos):
+                    break
+                field += quote
+                start = pos + len(quote)
+
+        # find the separator ending the field
+        fs_pos = buffer.find(fs, pos)
+        ls_pos = buffer.find(ls, pos)
+        if (ls_pos > -1) and ((fs_pos < 0) or (ls_pos <= fs_pos)):
+            end = ls_pos
+            last = True
+        elif fs_pos > -1:
+            end = fs_pos
+            last = False
+        elif eof:
+            end = len(buffer)
+            last = True
+        else:
+            return None
+        if (not eof) and (end + separator_length > len(buffer)):
+            # the separator might be the prefix of a longer one
+            return None
+
+        value = buffer[pos:end]
+        if last and crlf and value.endswith(b'\r'):
+            value = value[:-1]
+        fields.append(field + value)
 
-    return data
-### END read_from_csv_format ###
+        if last:
+            return (fields, end + len(ls))
+        pos = end + len(fs)
+### END parse_quoted_csv_record ###
 
 
 ### BEGIN write_to_odyssey_format ###
-# write_to_odyssey_format(config, data, collation_function, debug)
+# write_to_odyssey_format(config, data, collation, sorter, debug)
 # write data to the Odyssey format, using the config settings
+# data is sorted by word with sorter, so that definitions are stored in order
+# (see indexBuilder)
 #
 # config = [ dictionary_filename, index_filename, language_from, language_to,
 #            license_string, copyright_string, title, description, year, info_filename ]
@@ -356,7 +2095,7 @@ def read_from_csv_format(csv_input_filename, fs, ls, ignore_case):
 #        synonyms is a list of alternative strings for word
 #        substitutions is a list of pairs [ word_to_replace, replacement ]
 #        definition is the definition of word
-def write_to_odyssey_format(config, data, collation, debug):
+def write_to_odyssey_format(config, data, collation, sorter, debug):
 
     # Note: chunks on Odyssey seems have size between
     # 262144 = 2^18 and 524288 = 2^19 bytes
@@ -375,133 +2114,91 @@ def write_to_odyssey_format(config, data, collation, debug):
       year,
       info_filename ] = config
 
-    # copy empty.idx into index_filename
-    input_file = open('empty.idx', "rb")
-    output_file = open(index_filename, "wb")
-    output_file.write(input_file.read())
-    input_file.close()
-    output_file.close()
+    # the index is built from scratch
+    if os.path.exists(index_filename):
+        os.remove(index_filename)
 
-    # open index
-    sql_connection = sqlite3.connect(index_filename)
+    # build the index in memory, and copy it into index_filename when done,
+    # unless sqlite3 cannot do that (Python < 3.7), in which case
+    # the index is built directly in index_filename
+    in_memory = hasattr(sqlite3.Connection, "backup")
+    if in_memory:
+        sql_connection = sqlite3.connect(":memory:")
+    else:
+        sql_connection = sqlite3.connect(index_filename)
+
+    # the index is rebuilt from scratch if anything goes wrong,
+    # hence neither a rollback journal nor syncing to disk is needed while filling it
+    # (these must be set outside of any transaction)
+    sql_connection.execute('PRAGMA page_size=1024')
+    sql_connection.execute('PRAGMA journal_mode=OFF')
+    sql_connection.execute('PRAGMA synchronous=OFF')
 
     # install collation in the index
     if collation == None:
         print_info("Using built-in collation function...")
-        sql_connection.create_collation("IcuNoCase", collate_function_default)
+        collate = collationCache(collate_function_default, odyssey_sort_key)
     else:
         print_info("Using custom collation function...")
-        sql_connection.create_collation("IcuNoCase", collation.collate_function)
+        collate = collationCache(collation.collate_function, collation.collate_key)
+    sql_connection.create_collation("IcuNoCase", collate)
     sql_connection.text_factory = str
 
-    # get a cursor
+    # get a cursor, and create the tables
     sql_cursor = sql_connection.cursor()
-    # delete any data from the index (just for safety...)
-    sql_cursor.execute('delete from T_DictIndex ')
+    for statement in ODYSSEY_INDEX_TABLES:
+        sql_cursor.execute(statement)
 
     # open debug file
+    debug_file = None
     if debug:
         #Python2#        debug_file = open("debug." + dictionary_filename, "wb")
         #Python3#
         debug_file = open("debug." + dictionary_filename, "w", encoding="utf-8")
-    
-    # split data in chunks of size between MAX_CHUNK_SIZE and 2*MAX_CHUNK_SIZE bytes
-    byte_count = 0
-    current_chunk = 1
-    current_chunk_filename = CHUNK_STRING + str(current_chunk)
-    current_chunk_file = open(current_chunk_filename, "wb")
-    chunk_filenames = [ current_chunk_filename ]
-
-    # keep a dictionary of words, with their sql_tuples
-    global_dictionary = collections.defaultdict(list)
-
-    # keep a global list of substitutions
-    global_substitutions = []
-
-    # sort input data
-    data.sort()
-
-    for d in data:
-
-        # get data
-        word = d[0]
-        include = d[1]
-        synonyms = d[2]
-        substitutions = d[3]
-        if debug:
-            # augment readability of c_* files
-            definition = d[4] + "\n"
-        else:
-            # save 1 byte
-            definition = d[4]
-        #Python2#        definition_length = len(definition)
-        #Python3#
-        definition_length = len(bytearray(definition, "utf-8"))
 
-        if (include):
-            # write definition to debug file
-            if debug:
-                debug_file.write(definition)
+    # sort input data, unless it is sorted already
+    # (it is read once, hence it need not be stored)
+    if not isinstance(data, sortedEntries):
+        data = sorter(data)
 
-            # write definition to current chunk file
-            #Python2#            current_chunk_file.write(definition)
-            #Python3#
-            current_chunk_file.write(bytearray(definition, "utf-8")) 
-
-            # insert word into index file
-            sql_tuple = (0, word, byte_count, definition_length, current_chunk)
-            sql_cursor.execute('insert into T_DictIndex values (?,?,?,?,?)', sql_tuple)
-
-            # insert word into global dictionary
-            global_dictionary[word].append(sql_tuple)
-
-            # insert synonyms into index file, pointing at current definition
-            for s in synonyms:
-                sql_tuple = (0, s, byte_count, definition_length, current_chunk)
-                sql_cursor.execute('insert into T_DictIndex values (?,?,?,?,?)', sql_tuple)
-
-            # update byte count
-            byte_count += definition_length
-
-            # if the current chunk is complete, start new chunk Note: 262144 = 2^18
-            if (byte_count > SPLIT_CHUNK_SIZE):
-                current_chunk_file.close()
-                current_chunk += 1
-                current_chunk_filename = CHUNK_STRING + str(current_chunk)
-                current_chunk_file = open(current_chunk_filename, "wb")
-                chunk_filenames += [ current_chunk_filename ]
-                byte_count = 0
-        else:
-            if len(substitutions) > 0 :
-                global_substitutions += substitutions
+    # split definitions in chunks of size between SPLIT_CHUNK_SIZE and 2*SPLIT_CHUNK_SIZE bytes
+    chunks = chunkedFile(CHUNK_STRING, SPLIT_CHUNK_SIZE)
+    index = indexBuilder(chunks)
+    index.build(data, debug_file)
 
     # close output files
     if debug:
         debug_file.close()
-    current_chunk_file.close()
+    chunks.close()
 
     # zip chunk files into dictionary_filename
     dictionary_zip_file = zipfile.ZipFile(dictionary_filename, "w", zipfile.ZIP_DEFLATED)
-    for current_chunk_filename in chunk_filenames:
+    for current_chunk_filename in chunks.filenames:
         dictionary_zip_file.write(current_chunk_filename)
     dictionary_zip_file.close()
 
     # delete chunk files unless debug mode is on
     if not debug:
-        for current_chunk_filename in chunk_filenames:
+        for current_chunk_filename in chunks.filenames:
             os.remove(current_chunk_filename)
 
-    # process substitutions
-    for substitution in global_substitutions:
-        sub_from = substitution[0]
-        sub_to = substitution[1]
+    # insert words, synonyms and substitutions into index file,
+    # pointing at their definitions, in the order of the collation
+    if collation == None:
+        order = index.sorted_postings(sorter, odyssey_sort_key)
+    elif collation.collate_key != None:
+        order = index.sorted_postings(sorter, collation.collate_key)
+    else:
+        # the collation has no sorting key, hence sort in memory, comparing pairs of words
+        order = sorted(index.sorted_postings(sorter), key=collation_sort_key(index, collation.collate_function))
+        collate.add_ranks(index.key(i) for i in order)
+    sql_cursor.executemany('insert into T_DictIndex values (?,?,?,?,?)', odyssey_index_rows(index, chunks, order))
 
-        if sub_to in global_dictionary:
-            # TODO Possible issue if global_dictionary[sub_to] is a list!
-            # TODO If you define your own parser and you use substitutions, be aware of this!
-            sql_tuple = global_dictionary[sub_to]
-            sql_tuple = ( sql_tuple[0], sub_from, sql_tuple[2], sql_tuple[3], sql_tuple[4] )
-            sql_cursor.execute('insert into T_DictIndex values (?,?,?,?,?)', sql_tuple)
+    # create the indices of T_DictIndex only now,
+    # since inserting each row into the word index takes about log2(rows) calls
+    # to the collation function, while building it from rows sorted already takes fewer
+    for statement in ODYSSEY_INDEX_INDICES:
+        sql_cursor.execute(statement)
 
     # update index metadata
     header = "<!DOCTYPE html PUBLIC \"-//W3C//DTD XHTML 1.0 Strict//EN\"  \"http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd\" [<!ENTITY ns \"&#8226;\">]><html xml:lang=\"%s\" xmlns=\"http://www.w3.org/1999/xhtml\"><head><title></title></head><body>" % (language_from)
@@ -521,16 +2218,114 @@ def write_to_odyssey_format(config, data, collation, debug):
     sql_cursor.execute('update T_DictVersion set F_DictType=?', ('stardict',))
     sql_cursor.execute('update T_DictVersion set F_Version=?', ('11',))
 
-    # compact and close index
-    sql_cursor.execute('VACUUM')
+    # everything above is a single transaction
+    sql_connection.commit()
     sql_cursor.close()
+
+    # write the index to index_filename in one go
+    # (nothing was ever deleted from it, hence it needs no VACUUM)
+    if in_memory:
+        output_connection = sqlite3.connect(index_filename)
+        sql_connection.backup(output_connection)
+        output_connection.close()
     sql_connection.close()
 ### END write_to_odyssey_format ###
 
 
+### BEGIN odyssey_index_rows ###
+# odyssey_index_rows(index, chunks, order)
+# yield the rows of the odyssey index for the postings of the given indexBuilder,
+# taken in the given order, one at a time,
+# where chunks is the chunkedFile storing the definitions
+def odyssey_index_rows(index, chunks, order):
+    for i in order:
+        offset, definition_length = index.definition_location(index.reference(i))
+        current_chunk, chunk_offset = chunks.location(offset)
+        yield (0, index.key(i), chunk_offset, definition_length, current_chunk)
+### END odyssey_index_rows ###
+
+
+### BEGIN odyssey_sort_key ###
+# odyssey_sort_key(word)
+# the sorting key of word in the odyssey index,
+# matching collate_function_default
+def odyssey_sort_key(word):
+    #Python2#    return word.lower()
+    #Python3#
+    return word.encode("utf-8").lower()
+### END odyssey_sort_key ###
+
+
+### BEGIN collation_sort_key ###
+# collation_sort_key(index, collate_function)
+# return the sorting key of the postings of the given indexBuilder
+# matching the given collate_function(string1, string2)
+def collation_sort_key(index, collate_function):
+    compare = functools.cmp_to_key(collate_function)
+    return lambda i: compare(index.key(i))
+### END collation_sort_key ###
+
+
+### BEGIN collationCache ###
+# collationCache(collate_function, sort_key=None, max_size=COLLATION_CACHE_SIZE)
+# a collation function, to be installed in an index instead of collate_function,
+# comparing the sorting keys of the strings, which are computed once
+# and kept for (up to) max_size strings
+# the sorting key of a string is sort_key(string), if sort_key is not None,
+# and it must sort like collate_function does; otherwise, it is its rank
+# among the strings given to add_ranks, and strings without a rank
+# are compared by collate_function
+#
+# Note: the cache is emptied when it is full, which is cheaper than
+# keeping track of the least recently used strings
+class collationCache(object):
+
+    def __init__(self, collate_function, sort_key=None, max_size=COLLATION_CACHE_SIZE):
+        self.collate_function = collate_function
+        self.sort_key = sort_key
+        self.max_size = max_size
+        self.keys = {}
+
+    def __call__(self, string1, string2):
+        key1 = self.key(string1)
+        key2 = self.key(string2)
+        if (key1 == None) or (key2 == None):
+            return self.collate_function(string1, string2)
+        if key1 == key2:
+            return 0
+        return -1 if (key1 < key2) else 1
+
+    # return the sorting key of the given string, or None if it is not known
+    def key(self, string):
+        key = self.keys.get(string)
+        if (key == None) and (self.sort_key != None):
+            key = self.sort_key(string)
+            if len(self.keys) >= self.max_size:
+                self.keys.clear()
+            self.keys[string] = key
+        return key
+
+    # rank the given strings, sorted by collate_function already,
+    # so that strings comparing equal get the same rank
+    # (only the first max_size strings are ranked)
+    def add_ranks(self, strings):
+        rank = 0
+        previous = None
+        for string in strings:
+            if len(self.keys) >= self.max_size:
+                break
+            if (previous != None) and (self.collate_function(previous, string) != 0):
+                rank += 1
+            self.keys[string] = rank
+            previous = string
+### END collationCache ###
+
+
 ### BEGIN write_to_stardict_format ###
-# write_to_stardict_format(config, data, debug)
+# write_to_stardict_format(config, data, sorter, debug)
 # write data to the StarDict format, using the config settings
+# the index is sorted by word with sorter (see indexBuilder)
+# data might be an indexBuilder already (see build_index)
 #
 # config = [ dictionary_filename, index_filename, language_from, language_to,
 #            license_string, copyright_string, title, description, year, info_filename ]
@@ -543,7 +2338,7 @@ def write_to_odyssey_format(config, data, collation, debug):
 #        synonyms is a list of alternative strings for word
 #        substitutions is a list of pairs [ word_to_replace, replacement ]
 #        definition is the definition of word
-def write_to_stardict_format(config, data, debug):
+def write_to_stardict_format(config, data, sorter, debug):
 
     # read config parameters
     [ dictionary_filename,
@@ -559,127 +2354,88 @@ def write_to_stardict_format(config, data, debug):
 
 
     # open debug file
+    debug_file = None
     if debug:
         #Python2#        debug_file = open("debug." + dictionary_filename, "wb")
         #Python3#
         debug_file = open("debug." + dictionary_filename, "w", encoding="utf-8")
 
-    # keep a dictionary of words, with their sql_tuples
-    global_dictionary = collections.defaultdict(list)
-
-    # keep a global list of substitutions
-    global_substitutions = []
-
-    # sort input data
-    # data.sort()
-
-    # open dictionary file
+    # write the definitions to the dictionary file, while building the index
     dictionary_file = open(dictionary_filename, "wb")
-    byte_count = 0
-
-    for d in data:
-
-        # get data
-        word = d[0]
-        include = d[1]
-        synonyms = d[2]
-        substitutions = d[3]
-        if debug:
-            # augment readability of c_* files
-            definition = d[4] + "\n"
-        else:
-            # save 1 byte
-            definition = d[4]
-        #Python2#        definition_length = len(definition)
-        #Python3#
-        definition_bytes = bytearray(definition, "utf-8")
-        #Python3#
-        definition_length = len(definition_bytes)
-
-        if (include):
-            # write definition to debug file
-            if debug:
-                debug_file.write(definition)
-
-            # write definition to current chunk file
-            #Python2#            dictionary_file.write(definition)
-            #Python3#
-            dictionary_file.write(definition_bytes)
-
-            # insert word into global dictionary
-            sql_tuple = (word, byte_count, definition_length, 0)
-            global_dictionary[word].append(sql_tuple)
-
-            # insert synonyms into index file, pointing at current definition
-            for s in synonyms:
-                sql_tuple = (s, byte_count, definition_length, 0)
-                global_dictionary[s].append(sql_tuple)
-        else:
-            if len(substitutions) > 0 :
-                global_substitutions += substitutions
-
-        byte_count += definition_length
+    if isinstance(data, indexBuilder):
+        index = data
+        index.copy_definitions(dictionary_file)
+    else:
+        index = indexBuilder(dictionary_file)
+        index.build(data, debug_file)
+    dictionary_file.close()
 
     # close output files
     if debug:
         debug_file.close()
-    dictionary_file.close()
 
-    # process substitutions
-    for substitution in global_substitutions:
-        sub_from = substitution[0]
-        sub_to = substitution[1]
+    # sort postings (needed by StarDict format)
+    postings = index.sorted_postings(sorter)
 
-        if sub_to in global_dictionary:
-            # TODO Possible issue if global_dictionary[sub_to] is a list!
-            # TODO If you define your own parser and you use substitutions, be aware of this!
-            sql_tuple = global_dictionary[sub_to]
-            sql_tuple = ( sub_from, sql_tuple[1], sql_tuple[2], sql_tuple[3] )
-            global_dictionary[sub_from].append(sql_tuple)
-
-
-    # sort keys (needed by StarDict format)
-    #Python2#    keys = global_dictionary.keys()
-    #Python3#
-    keys = list(global_dictionary.keys())
-    keys.sort()
+    # offsets are 32 bit, unless the dictionary file is too large
+    # (some readers treat them as signed, hence the 2^31 limit)
+    if index.definition_size() >= 2 ** 31:
+        offset_bits = 64
+        offset_format = '>Q'
+    else:
+        offset_bits = 32
+        offset_format = '>I'
 
-    # write index file
+    # write index file, keeping track of the position of the word of each definition
+    # which is the entry index referenced by the synonyms
+    entry_index = offset_array([ 0 ]) * index.definition_count()
+    word_count = 0
     index_file = open(index_filename, "wb")
-    for k in keys:
-        if type(global_dictionary[k]) is tuple:
-            # single keyword
-            sql_tuple = global_dictionary[k]
-            #Python2#            index_file.write(sql_tuple[0])
-            #Python2#            index_file.write('\0')
-            #Python3#
-            index_file.write(bytearray(sql_tuple[0], "utf-8"))
-            #Python3#
+    for i in postings:
+        if not index.is_synonym(i):
+            n = index.reference(i)
+            offset, definition_length = index.definition_location(n)
+            index_file.write(index.key_bytes(i))
             index_file.write(b'\0')
-            index_file.write(struct.pack('>i', sql_tuple[1]))
-            index_file.write(struct.pack('>i', sql_tuple[2]))
-        else:
-            # multiple keyword
-            for sql_tuple in global_dictionary[k]:
-                #Python2#                index_file.write(sql_tuple[0])
-                #Python2#                index_file.write('\0')
-                #Python3#
-                index_file.write(bytearray(sql_tuple[0], "utf-8"))
-                #Python3#
-                index_file.write(b'\0')
-                index_file.write(struct.pack('>i', sql_tuple[1]))
-                index_file.write(struct.pack('>i', sql_tuple[2]))
+            index_file.write(struct.pack(offset_format, offset))
+            index_file.write(struct.pack('>I', definition_length))
+            entry_index[n] = word_count
+            word_count += 1
     index_file.close()
 
+    # write synonym file, if needed
+    # each record is the synonym followed by the (32 bit) index of its entry
+    syn_count = 0
+    syn_filename = os.path.splitext(index_filename)[0] + ".syn"
+    syn_file = None
+    for i in postings:
+        if index.is_synonym(i):
+            if syn_file == None:
+                syn_file = open(syn_filename, "wb")
+            syn_file.write(index.key_bytes(i))
+            syn_file.write(b'\0')
+            syn_file.write(struct.pack('>I', entry_index[index.reference(i)]))
+            syn_count += 1
+    if syn_file != None:
+        syn_file.close()
+
 
     # write info file
     #Python2#    info_file = open(info_filename, "wb")
     #Python3#
     info_file = open(info_filename, "w", encoding="utf-8")
     info_file.write("StarDict's dict ifo file\n")
-    info_file.write("version=2.4.2\n")
-    info_file.write("wordcount=" + str(len(keys)) + "\n")
+    # idxoffsetbits is honoured in version 3.0.0 files only
+    if offset_bits == 64:
+        info_file.write("version=3.0.0\n")
+    else:
+        info_file.write("version=2.4.2\n")
+    info_file.write("wordcount=" + str(word_count) + "\n")
+    if syn_count > 0:
+        info_file.write("synwordcount=" + str(syn_count) + "\n")
     info_file.write("idxfilesize=" + str(os.path.getsize(index_filename)) + "\n")
+    if offset_bits == 64:
+        info_file.write("idxoffsetbits=64\n")
     info_file.write("bookname=" + title + "\n")
     info_file.write("date=" + year + "\n")
     info_file.write("sametypesequence=m\n")
@@ -693,8 +2449,10 @@ def write_to_stardict_format(config, data, debug):
 
 
 ### BEGIN write_to_xml_format ###
-# write_to_xml_format(config, data, debug)
+# write_to_xml_format(config, data, sorter, debug)
 # write data to the XML format, using the config settings
+# the entries are sorted by word with sorter (see indexBuilder)
+# data might be an indexBuilder already (see build_index)
 #
 # config = [ dictionary_filename, index_filename, language_from, language_to,
 #            license_string, copyright_string, title, description, year, info_filename ]
@@ -707,7 +2465,7 @@ def write_to_stardict_format(config, data, debug):
 #        synonyms is a list of alternative strings for word
 #        substitutions is a list of pairs [ word_to_replace, replacement ]
 #        definition is the definition of word
-def write_to_xml_format(config, data, debug):
+def write_to_xml_format(config, data, sorter, debug):
  
     # read config parameters
     [ dictionary_filename,
@@ -723,77 +2481,11 @@ def write_to_xml_format(config, data, debug):
 
 
     # open debug file
+    debug_file = None
     if debug:
-        debug_file = open("debug." + dictionary_filename, "wb")
-
-    # keep a dictionary of words, with their sql_tuples
-    global_dictionary = collections.defaultdict(list)
-
-    # keep a global list of substitutions
-    global_substitutions = []
-
-    # sort input data
-    # data.sort()
-
-    # load dictionary
-    byte_count = 0
-
-    for d in data:
-
-        # get data
-        word = d[0]
-        include = d[1]
-        synonyms = d[2]
-        substitutions = d[3]
-        if debug:
-            # augment readability of c_* files
-            definition = d[4] + "\n"
-        else:
-            # save 1 byte
-            definition = d[4]
-        definition_length = len(definition)
-
-        if (include):
-            # append word into log file
-            if debug:
-                debug_file.write(word + "\n")
-
-            # insert word into global dictionary
-            sql_tuple = (word, byte_count, definition_length, 0, definition)
-            global_dictionary[word].append(sql_tuple)
-
-            # insert synonyms into index file, pointing at current definition
-            for s in synonyms:
-                sql_tuple = (s, byte_count, definition_length, 0, definition)
-                global_dictionary[s].append(sql_tuple)
-        else:
-            if len(substitutions) > 0 :
-                global_substitutions += substitutions
-
-        byte_count += definition_length
-
-    # close output files
-    if debug:
-        debug_file.close()
-
-    # process substitutions
-    for substitution in global_substitutions:
-        sub_from = substitution[0]
-        sub_to = substitution[1]
-
-        if sub_to in global_dictionary:
-            # TODO Possible issue if global_dictionary[sub_to] is a list!
-            # TODO If you define your own parser and you use substitutions, be aware of this!
-            sql_tuple = global_dictionary[sub_to]
-            sql_tuple = ( sub_from, sql_tuple[1], sql_tuple[2], sql_tuple[3], sql_tuple[4] )
-            global_dictionary[sub_from].append(sql_tuple)
-
-
-    # sort keys (needed by StarDict format)
-    #Python2#    keys = global_dictionary.keys()
-    #Python3#
-    keys = list(global_dictionary.keys())
-    keys.sort()
+        #Python2#        debug_file = open("debug." + dictionary_filename, "wb")
+        #Python3#
+        debug_file = open("debug." + dictionary_filename, "w", encoding="utf-8")
 
     # output to XML format
     #Python2#    f = open(dictionary_filename, "wb")
@@ -802,25 +2494,27 @@ def write_to_xml_format(config, data, debug):
     f.write("<?xml version=\"1.0\" encoding=\"utf-8\"?>")
     f.write("<!DOCTYPE document SYSTEM \"dictionary.dtd\">")
     f.write("<dictionary>")
-    for k in keys:
-        word = xml.sax.saxutils.escape(k)
-        if type(global_dictionary[k]) is tuple:
-            # single keyword
-            definition = xml.sax.saxutils.escape(global_dictionary[k][4])
-            f.write("<entry><key>%s</key><def>%s</def></entry>" % (word, definition))
-        else:
-            # multiple keyword
-            for sql_tuple in global_dictionary[k]:
-                definition = xml.sax.saxutils.escape(sql_tuple[4])
-                f.write("<entry><key>%s</key><def>%s</def></entry>" % (word, definition))
+    index = build_index(data, debug_file)
+    for i in index.sorted_postings(sorter):
+        word = xml.sax.saxutils.escape(index.key(i))
+        definition = xml.sax.saxutils.escape(index.definition(index.reference(i)))
+        f.write("<entry><key>%s</key><def>%s</def></entry>" % (word, definition))
     f.write("</dictionary>")
     f.close()
+
+    # close debug file
+    if debug:
+        debug_file.close()
 ### END write_to_xml_format ###
 
 
 ### BEGIN write_to_csv_format ###
-# write_to_csv_format(config, data, fs, ls, debug)
+# write_to_csv_format(config, data, fs, ls, quote, sorter, debug)
 # write data to the csv format, using the config settings
+# the entries are sorted by word with sorter (see indexBuilder)
+# data might be an indexBuilder already (see build_index)
+# if quote is not None, fields containing fs, ls or quote are quoted
+# (see read_quoted_csv_records), otherwise ls is replaced by a space in definitions
 #
 # config = [ dictionary_filename, index_filename, language_from, language_to,
 #            license_string, copyright_string, title, description, year, info_filename ]
@@ -833,7 +2527,7 @@ def write_to_xml_format(config, data, debug):
 #        synonyms is a list of alternative strings for word
 #        substitutions is a list of pairs [ word_to_replace, replacement ]
 #        definition is the definition of word
-def write_to_csv_format(config, data, fs, ls, debug):
+def write_to_csv_format(config, data, fs, ls, quote, sorter, debug):
  
     # read config parameters
     [ dictionary_filename,
@@ -849,99 +2543,51 @@ def write_to_csv_format(config, data, fs, ls, debug):
 
 
     # open debug file
+    debug_file = None
     if debug:
-        debug_file = open("debug." + dictionary_filename, "wb")
-
-    # keep a dictionary of words, with their sql_tuples
-    global_dictionary = collections.defaultdict(list)
-
-    # keep a global list of substitutions
-    global_substitutions = []
-
-    # sort input data
-    # data.sort()
-
-    # load dictionary
-    byte_count = 0
-
-    for d in data:
-
-        # get data
-        word = d[0]
-        include = d[1]
-        synonyms = d[2]
-        substitutions = d[3]
-        if debug:
-            # augment readability of c_* files
-            definition = d[4] + "\n"
-        else:
-            # save 1 byte
-            definition = d[4]
-        definition_length = len(definition)
-
-        if (include):
-            # append word into log file
-            if debug:
-                debug_file.write(word + "\n")
-
-            # insert word into global dictionary
-            sql_tuple = (word, byte_count, definition_length, 0, definition)
-            global_dictionary[word].append(sql_tuple)
-
-            # insert synonyms into index file, pointing at current definition
-            for s in synonyms:
-                sql_tuple = (s, byte_count, definition_length, 0, definition)
-                global_dictionary[s].append(sql_tuple)
-        else:
-            if len(substitutions) > 0 :
-                global_substitutions += substitutions
-
-        byte_count += definition_length
-
-    # close output files
-    if debug:
-        debug_file.close()
-
-    # process substitutions
-    for substitution in global_substitutions:
-        sub_from = substitution[0]
-        sub_to = substitution[1]
-
-        if sub_to in global_dictionary:
-            # TODO Possible issue if global_dictionary[sub_to] is a list!
-            # TODO If you define your own parser and you use substitutions, be aware of this!
-            sql_tuple = global_dictionary[sub_to]
-            sql_tuple = ( sub_from, sql_tuple[1], sql_tuple[2], sql_tuple[3], sql_tuple[4] )
-            global_dictionary[sub_from].append(sql_tuple)
-
-    # sort keys (needed by StarDict format)
-    #Python2#    keys = global_dictionary.keys()
-    #Python3#
-    keys = list(global_dictionary.keys())
-    keys.sort()
+        #Python2#        debug_file = open("debug." + dictionary_filename, "wb")
+        #Python3#
+        debug_file = open("debug." + dictionary_filename, "w", encoding="utf-8")
 
     # output to CSV format
     #Python2#    f = open(dictionary_filename, "wb")
     #Python3#
     f = open(dictionary_filename, "w", encoding="utf-8")
-    for k in keys:
-        word = k
-        if type(global_dictionary[k]) is tuple:
-            # single keyword
-            definition = global_dictionary[k][4].replace(ls, " ")
-            f.write("%s%s%s%s" % (word, fs, definition, ls))
+    index = build_index(data, debug_file)
+    for i in index.sorted_postings(sorter):
+        word = index.key(i)
+        definition = index.definition(index.reference(i))
+        if quote != None:
+            word = quote_csv_field(word, fs, ls, quote)
+            definition = quote_csv_field(definition, fs, ls, quote)
         else:
-            # multiple keyword
-            for sql_tuple in global_dictionary[k]:
-                definition = sql_tuple[4].replace(ls, " ")
-                f.write("%s%s%s%s" % (word, fs, definition, ls))
+            definition = definition.replace(ls, " ")
+        f.write("%s%s%s%s" % (word, fs, definition, ls))
     f.close()
+
+    # close debug file
+    if debug:
+        debug_file.close()
 ### END write_to_csv_format ###
 
 
+### BEGIN quote_csv_field ###
+# quote_csv_field(field, fs, ls, quote)
+# quote the given field, if it contains fs, ls or quote,
+# or if it ends in "\r" and ls is "\n"
+# (as the reader takes "\r\n" as a line separator, see parse_quoted_csv_record)
+def quote_csv_field(field, fs, ls, quote):
+    if (fs in field) or (ls in field) or (quote in field) or ((ls == "\n") and field.endswith("\r")):
+        return quote + field.replace(quote, quote + quote) + quote
+    return field
+### END quote_csv_field ###
+
+
 ### BEGIN write_to_epub_format ###
-# write_to_epub_format(config, data, debug)
+# write_to_epub_format(config, data, sorter, debug)
 # write data to the EPUB format, using the config settings
+# the index is sorted by word with sorter (see indexBuilder)
+# data might be an indexBuilder already (see build_index)
 #
 # config = [ dictionary_filename, index_filename, language_from, language_to,
 #            license_string, copyright_string, title, description, year, info_filename ]
@@ -954,7 +2600,7 @@ def write_to_csv_format(config, data, fs, ls, debug):
 #        synonyms is a list of alternative strings for word
 #        substitutions is a list of pairs [ word_to_replace, replacement ]
 #        definition is the definition of word
-def write_to_epub_format(config, data, debug):
+def write_to_epub_format(config, data, sorter, debug):
  
     # read config parameters
     [ dictionary_filename,
@@ -970,83 +2616,34 @@ def write_to_epub_format(config, data, debug):
 
 
     # open debug file
+    debug_file = None
     if debug:
-        debug_file = open("debug." + dictionary_filename, "wb")
-
-    # keep a dictionary of words, with their sql_tuples
-    global_dictionary = collections.defaultdict(list)
-
-    # keep a global list of substitutions
-    global_substitutions = []
-
-    # sort input data
-    # data.sort()
-
-    # load dictionary
-    byte_count = 0
-
-    for d in data:
-
-        # get data
-        word = d[0]
-        include = d[1]
-        synonyms = d[2]
-        substitutions = d[3]
-        if debug:
-            # augment readability of c_* files
-            definition = d[4] + "\n"
-        else:
-            # save 1 byte
-            definition = d[4]
-        definition_length = len(definition)
-
-        if (include):
-            # append word into log file
-            if debug:
-                debug_file.write(word + "\n")
-
-            # insert word into global dictionary
-            sql_tuple = (word, byte_count, definition_length, 0, definition)
-            global_dictionary[word].append(sql_tuple)
-
-            # insert synonyms into index file, pointing at current definition
-            for s in synonyms:
-                sql_tuple = (s, byte_count, definition_length, 0, definition)
-                global_dictionary[s].append(sql_tuple)
-        else:
-            if len(substitutions) > 0 :
-                global_substitutions += substitutions
+        #Python2#        debug_file = open("debug." + dictionary_filename, "wb")
+        #Python3#
+        debug_file = open("debug." + dictionary_filename, "w", encoding="utf-8")
 
-        byte_count += definition_length
+    # build the index
+    # (the EPUB file contains the index only, hence the definitions are not kept)
+    if isinstance(data, indexBuilder):
+        index = data
+    else:
+        index = indexBuilder()
+        index.build(data, debug_file)
 
     # close output files
     if debug:
         debug_file.close()
 
-    # process substitutions
-    for substitution in global_substitutions:
-        sub_from = substitution[0]
-        sub_to = substitution[1]
-
-        if sub_to in global_dictionary:
-            # TODO Possible issue if global_dictionary[sub_to] is a list!
-            # TODO If you define your own parser and you use substitutions, be aware of this!
-            sql_tuple = global_dictionary[sub_to]
-            sql_tuple = ( sub_from, sql_tuple[1], sql_tuple[2], sql_tuple[3], sql_tuple[4] )
-            global_dictionary[sub_from].append(sql_tuple)
-
-
-    # sort keys (needed by StarDict format)
-    #Python2#    keys = global_dictionary.keys()
-    #Python3#
-    keys = list(global_dictionary.keys())
-    keys.sort()
-
+    # sort keys, skipping repeated ones
     clean_keys = []
-    for k in keys:
-        #Python2#        clean_keys += [ unicode(k) ]
-        #Python3#
-        clean_keys += [ k ]
+    previous = None
+    for i in index.sorted_postings(sorter):
+        k = index.key(i)
+        if k != previous:
+            #Python2#            clean_keys += [ unicode(k) ]
+            #Python3#
+            clean_keys += [ k ]
+            previous = k
 
     # output to EPUB
     #Python2#    d = dictEPUB()
@@ -1057,8 +2654,11 @@ def write_to_epub_format(config, data, debug):
 
 
 ### BEGIN write_to_kobo_format ###
-# write_to_kobo_format(config, data, debug)
+# write_to_kobo_format(config, data, sorter, debug)
 # write data to the Kobo format, using the config settings
+# the entries are sorted with sorter (see indexBuilder)
+# by XX.html file first, and then by word, so that each file is written at once
+# data might be an indexBuilder already (see build_index)
 #
 # config = [ dictionary_filename, index_filename, language_from, language_to,
 #            license_string, copyright_string, title, description, year, info_filename ]
@@ -1071,7 +2671,7 @@ def write_to_epub_format(config, data, debug):
 #        synonyms is a list of alternative strings for word
 #        substitutions is a list of pairs [ word_to_replace, replacement ]
 #        definition is the definition of word
-def write_to_kobo_format(config, data, debug):
+def write_to_kobo_format(config, data, sorter, debug):
 
     # read config parameters
     [ dictionary_filename,
@@ -1087,128 +2687,45 @@ def write_to_kobo_format(config, data, debug):
 
 
     # open debug file
+    debug_file = None
     if debug:
         #Python2#        debug_file = open("debug." + dictionary_filename, "wb")
         #Python3#
         debug_file = open("debug." + dictionary_filename, "w", encoding="utf-8")
 
-    # keep a dictionary of words, with their sql_tuples
-    global_dictionary = collections.defaultdict(list)
-
-    # keep a global list of substitutions
-    global_substitutions = []
-
-    # sort input data
-    # data.sort()
-
-    # load dictionary
-    byte_count = 0
-
-    for d in data:
-
-        # get data
-        word = d[0]
-        include = d[1]
-        synonyms = d[2]
-        substitutions = d[3]
-        if debug:
-            # augment readability of c_* files
-            definition = d[4] + "\n"
-        else:
-            # save 1 byte
-            definition = d[4]
-        definition_length = len(definition)
-
-        if (include):
-            # append word into log file
-            if debug:
-                debug_file.write(word + "\n")
-
-            # insert word into global dictionary
-            sql_tuple = (word, byte_count, definition_length, 0, definition)
-            global_dictionary[word].append(sql_tuple)
-
-            # insert synonyms into index file, pointing at current definition
-            for s in synonyms:
-                sql_tuple = (s, byte_count, definition_length, 0, definition)
-                global_dictionary[s].append(sql_tuple)
-        else:
-            if len(substitutions) > 0 :
-                global_substitutions += substitutions
-
-        byte_count += definition_length
-
-    # close output files
-    if debug:
-        debug_file.close()
-
-    # process substitutions
-    for substitution in global_substitutions:
-        sub_from = substitution[0]
-        sub_to = substitution[1]
-
-        if sub_to in global_dictionary:
-            # TODO Possible issue if global_dictionary[sub_to] is a list!
-            # TODO If you define your own parser and you use substitutions, be aware of this!
-            sql_tuple = global_dictionary[sub_to]
-            sql_tuple = ( sub_from, sql_tuple[1], sql_tuple[2], sql_tuple[3], sql_tuple[4] )
-            global_dictionary[sub_from].append(sql_tuple)
-
-
-    # sort keys (needed by StarDict format)
-    #Python2#    keys = global_dictionary.keys()
-    #Python3#
-    keys = list(global_dictionary.keys())
-    keys.sort()
-
     # store file names of the HTML files
     # to be included in the ZIP file
     fileNames = []
-    fileIDs = []
 
-    # compute dictionary with (XX, key) entries
-    fileToKey = dict()
-    for k in keys:
-        pref = compute_prefix(k)
-        if pref in fileToKey:
-            fileToKey[pref] += [ k ]
-        else:
-            fileToKey[pref] = [ k ] 
-        if pref not in fileIDs:
-            fileIDs += [ pref ]
+    # keep the set of the words, for the index
+    keys = set()
+
+    # output definitions, one XX.html file at a time
+    f = None
+    index = build_index(data, debug_file)
+    for i in index.sorted_postings(sorter, kobo_sort_key):
+        word = index.key(i)
+        definition = index.definition(index.reference(i))
+        keys.add(word)
+        pref = compute_prefix(word)
+        if (f == None) or (pref != fileNames[-1][:-len(".html")]):
+            if f != None:
+                close_kobo_html_file(f)
+            f = open_kobo_html_file(pref + ".html")
             fileNames += [ pref + ".html" ]
-    
-    # output definitions
-    for p in fileIDs:
-        #Python2#        f = open(p + ".html", "wb")
+        #Python2#        f.write("<w><a name=\"%s\"/><div><b>%s</b><br/>%s</div></w>" % (word, word, definition))
         #Python3#
-        f = open(p + ".html", "w", encoding="utf-8")
-        f.write("<?xml version=\"1.0\" encoding=\"utf-8\"?><html>")
-        for k in fileToKey[p]:
-            word = k
-            if type(global_dictionary[k]) is tuple:
-                # single keyword
-                definition = global_dictionary[k][4]
-                f.write("<w><a name=\"%s\"/><div><b>%s</b><br/>%s</div></w>" % (word, word, definition))
-            else:
-                # multiple keyword
-                for sql_tuple in global_dictionary[k]:
-                    definition = sql_tuple[4]
-                    f.write("<w><a name=\"%s\"/><div><b>%s</b><br/>%s</div></w>" % (word, word, definition))
-        f.write("</html>")
-        f.close()
-
-        # compress with gzip
-        f = open(p + ".html", "rb")
-        f_out = gzip.open(p + ".html.gz", "wb")
-        f_out.writelines(f)
-        f_out.close()
-        f.close()
-
-        # remove .gz
-        os.unlink(p + ".html")
-        os.rename(p + ".html.gz", p + ".html")
-    
+        f.write(bytearray("<w><a name=\"%s\"/><div><b>%s</b><br/>%s</div></w>" % (word, word, definition), "utf-8"))
+    if f != None:
+        close_kobo_html_file(f)
+
+    # close debug file
+    if debug:
+        debug_file.close()
+
+    # sort keys
+    keys = sorted(keys)
+
     # accumulate index file
     #Python2#    index_file = ""
     #Python3#
@@ -1240,6 +2757,33 @@ def write_to_kobo_format(config, data, debug):
 ### END write_to_kobo_format ###
 
 
+### BEGIN open_kobo_html_file ###
+# open_kobo_html_file(filename)
+# create the given gzipped XX.html file, and write its header
+def open_kobo_html_file(filename):
+    f = gzip.open(filename, "wb")
+    f.write(b'<?xml version="1.0" encoding="utf-8"?><html>')
+    return f
+### END open_kobo_html_file ###
+
+
+### BEGIN close_kobo_html_file ###
+# close_kobo_html_file(f)
+# write the footer of the given XX.html file, and close it
+def close_kobo_html_file(f):
+    f.write(b'</html>')
+    f.close()
+### END close_kobo_html_file ###
+
+
+### BEGIN kobo_sort_key ###
+# kobo_sort_key(word)
+# the sorting key of word in a Kobo dictionary: the XX.html file storing it, and word
+def kobo_sort_key(word):
+    return (compute_prefix(word), word)
+### END kobo_sort_key ###
+
+
 ### BEGIN compute_prefix ###
 # compute_prefix(keyword)
 # compute the correct Kobo file name where keyword should be stored
@@ -1355,18 +2899,21 @@ def compress_StarDict_dictionary(dictionary_filename, compressed_dictionary_file
 # --output-kobo : output format is Kobo
 # --output-csv : output format is CSV
 # --output-epub : output format is epub
+# --quote : CSV quote character
 # --collation : collation function to be used while outputting to Bookeen Cybook Odyssey format
+# --jobs : number of parallel workers to be used while reading and sorting
+# --sort-memory : memory budget (in MB) for sorting, spilling to temporary files beyond it
 def read_command_line_parameters(argv):
 
     try:
         optlist, free = getopt.getopt(argv[1:], 'dhizf:p:t:',
             ['license=', 'copyright=', 'title=',
                 'description=', 'year=', 'parser=',
-                'fs=', 'ls=',
+                'fs=', 'ls=', 'quote=',
                 'sd', 'odyssey', 'xml', 'kobo', 'csv',
                 'output-odyssey', 'output-sd', 'output-xml', 'output-kobo', 'output-csv',
                 'output-epub',
-                'collation='])
+                'collation=', 'jobs=', 'sort-memory='])
     #Python2#    except getopt.GetoptError, err:
     #Python3#
     except getopt.GetoptError as err:
@@ -1466,6 +3013,11 @@ def read_command_line_parameters(argv):
         ls = escape_ascii(optdict['--ls'])
     else:
         ls = "\n"
+
+    if '--quote' in optdict:
+        quote = escape_ascii(optdict['--quote'])
+    else:
+        quote = None
     
     debug = False
     if '-d' in optdict:
@@ -1484,10 +3036,29 @@ def read_command_line_parameters(argv):
     else:
         collation_filename = None
 
+    jobs = 1
+    if '--jobs' in optdict:
+        try:
+            jobs = int(optdict['--jobs'])
+        except ValueError:
+            jobs = 0
+        if jobs < 1:
+            print_error('The number of jobs must be a positive integer.')
+
+    sort_memory = None
+    if '--sort-memory' in optdict:
+        try:
+            sort_memory = int(optdict['--sort-memory'])
+        except ValueError:
+            sort_memory = 0
+        if sort_memory < 1:
+            print_error('The sort memory must be a positive integer (MB).')
+
     return [ prefix_list, language_from, language_to,
              license_string, copyright_string, title, description, year,
              debug, ignore_case, parser_filename, create_zip,
-             input_format, output_format, fs, ls, collation_filename ]
+             input_format, output_format, fs, ls, quote, collation_filename, jobs,
+             sort_memory ]
 ### END read_command_line_parameters ###
 
 
@@ -1549,51 +3120,77 @@ def check_ifo_file(ifo_filename):
 ### END check_ifo_file ###
 
 
+### BEGIN read_ifo_offset_bits ###
+# read_ifo_offset_bits(ifo_filename)
+# return the size in bits (32 or 64) of the offsets
+# stored in the index file, read from the idxoffsetbits field of ifo_filename
+def read_ifo_offset_bits(ifo_filename):
+    offset_bits = 32
+    #Python2#    ifo_file = open(ifo_filename, "rb")
+    #Python3#
+    ifo_file = open(ifo_filename, "r")
+    for line in ifo_file:
+        if line.strip().startswith('idxoffsetbits='):
+            offset_bits = int(line.strip().split('=')[1])
+    ifo_file.close()
+    return offset_bits
+### END read_ifo_offset_bits ###
+
+
 ### BEGIN check_idx_file ###
 # check_idx_file(idx_filename)
-# checks that idx_filename exists, uncompressing it if it was compressed
+# checks that idx_filename exists, or its compressed version idx_filename.gz,
+# and return the name of the file to be read (None if none exists)
+#
+# Note: compressed files are not uncompressed on disk,
+# since they are decompressed while reading (see read_stardict_index_stream)
 def check_idx_file(idx_filename):
     uncompressed = idx_filename
     compressed = idx_filename + ".gz"
 
     if os.path.isfile(uncompressed):
-        return True
+        return uncompressed
 
     if os.path.isfile(compressed):
-        #Python2#        uncompressed_idx_file = open(uncompressed, "wb")
-        #Python2#        compressed_idx_file = gzip.open(compressed, "rb")
-        #Python3#
-        uncompressed_idx_file = open(uncompressed, "w", encoding="utf-8")
-        #Python3#
-        compressed_idx_file = gzip.open(compressed, "r")
-        uncompressed_idx_file.write(compressed_idx_file.read())
-        compressed_idx_file.close()
-        uncompressed_idx_file.close()
-        return True
+        return compressed
 
-    return False
+    return None
 ### END check_idx_file ###
 
 
+### BEGIN gunzip_file ###
+# gunzip_file(compressed_filename)
+# uncompress the given .gz file into a sibling file without the .gz extension,
+# and return the name of the latter
+def gunzip_file(compressed_filename):
+    uncompressed_filename = compressed_filename[:-len(".gz")]
+    compressed_file = gzip.open(compressed_filename, "rb")
+    uncompressed_file = open(uncompressed_filename, "wb")
+    shutil.copyfileobj(compressed_file, uncompressed_file)
+    uncompressed_file.close()
+    compressed_file.close()
+    return uncompressed_filename
+### END gunzip_file ###
+
+
 ### BEGIN check_dict_file ###
 # check_dict_file(dict_filename)
-# checks that dict_filename exists, uncompressing it if it was compressed
+# checks that dict_filename exists, or its compressed version dict_filename.dz,
+# and return the name of the file to be read (None if none exists)
+#
+# Note: compressed files are not uncompressed on disk,
+# since they are read in place (see dictzipFile)
 def check_dict_file(dict_filename):
     uncompressed = dict_filename
     compressed = dict_filename + ".dz"
 
     if os.path.isfile(uncompressed):
-        return True
+        return uncompressed
 
     if os.path.isfile(compressed):
-        uncompressed_idx_file = open(uncompressed, "wb")
-        compressed_idx_file = gzip.open(compressed, "rb")
-        uncompressed_idx_file.write(compressed_idx_file.read())
-        compressed_idx_file.close()
-        uncompressed_idx_file.close()
-        return True
+        return compressed
 
-    return False
+    return None
 ### END check_dict_file ###
 
 
@@ -1643,6 +3240,13 @@ def check_parser(parser_filename):
 ### BEGIN check_collation ###
 # check_collation(collation_filename)
 # checks that collation_filename exists and can be loaded
+#
+# Note: a collation must define collate_function(string1, string2),
+# and it might define collate_key(string) as well, returning a sorting key
+# such that collate_function(string1, string2) compares
+# collate_key(string1) to collate_key(string2); the sorting key
+# must be made of strings, bytes, numbers and tuples (see externalSorter)
+# if collate_key is not defined, it is set to None
 def check_collation(collation_filename):
     if collation_filename == None:
         return None
@@ -1650,8 +3254,14 @@ def check_collation(collation_filename):
     if not os.path.isfile(collation_filename):
         return None
     try:
-        collation = imp.load_source('', collation_filename)
+        # the module has a known name, so that its collate_key can be told apart
+        # when it is sent to worker processes (see sort_in_parallel)
+        collation = imp.load_source(COLLATION_MODULE_NAME, collation_filename)
         collation.collate_function('', '')
+        if hasattr(collation, "collate_key"):
+            collation.collate_key('')
+        else:
+            collation.collate_key = None
     except Exception:
         return None
 
@@ -1724,7 +3334,7 @@ def usage():
     print_(" --sd                   : input dictionary in StarDict format (default)")
     print_(" --odyssey              : input dictionary in Bookeen Cybook Odyssey format")
     print_(" --xml                  : input dictionary in XML format")
-    print_(" --kobo                 : input dictionary in Kobo format (reads the index only!)")
+    print_(" --kobo                 : input dictionary in Kobo format (unencrypted/unobfuscated only)")
     print_(" --csv                  : input dictionary in CSV format")
     print_(" --output-odyssey       : output dictionary in Bookeen Cybook Odyssey format (default)")
     print_(" --output-sd            : output dictionary in StarDict format")
@@ -1741,6 +3351,9 @@ def usage():
     print_(" --collation <coll.py>  : use <coll.py> as collation function when outputting in Bookeen Cybook Odyssey format")
     print_(" --fs <string>          : use <string> as CSV field separator, escaping ASCII sequences (default: \\t)")
     print_(" --ls <string>          : use <string> as CSV line separator, escaping ASCII sequences (default: \\n)")
+    print_(" --quote <string>       : read and write CSV fields containing separators between <string> quotes (default: no quoting)")
+    print_(" --jobs <n>             : use up to <n> parallel workers while reading and sorting dictionaries (default: 1)")
+    print_(" --sort-memory <n>      : sort using about <n> MB of memory, and temporary files beyond it (default: sort in memory)")
     print_("")
     print_("Examples:")
     print_("$ %s %s -h" % (e, s))
@@ -1757,6 +3370,8 @@ def usage():
     print_("$ %s %s           -p foo -f en -t en --parser foo_parser.py --title \"Custom EN dictionary\"" % (e, s))
     print_("$ %s %s           -p foo -f en -t en --collation custom_collation.py" % (e, s))
     print_("$ %s %s --xml     -p foo -f en -t en --output-csv --fs \"\\t\\t\" --ls \"\\n\" " % (e, s))
+    print_("$ %s %s --xml     -p foo -f en -t en --output-sd --jobs 4" % (e, s))
+    print_("$ %s %s --xml     -p foo -f en -t en --output-kobo --sort-memory 1024" % (e, s))
     print_("")
 ### END usage ###
 
@@ -1780,7 +3395,10 @@ def main():
       output_format,
       fs,
       ls,
-      collation_filename ] = read_command_line_parameters(sys.argv)
+      quote,
+      collation_filename,
+      jobs,
+      sort_memory ] = read_command_line_parameters(sys.argv)
 
     type_sequence = 'unknown'
 
@@ -1789,6 +3407,8 @@ def main():
         ifo_input_filename_list = []
         idx_input_filename_list = []
         dict_input_filename_list = []
+        syn_input_filename_list = []
+        offset_bits_list = []
         for prefix in prefix_list:
             # check ifo input file
             ifo_input_filename = prefix + ".ifo"
@@ -1797,21 +3417,26 @@ def main():
                 print_error("File " + ifo_input_filename + " not found or with wrong format.")
             print_info("Input dictionary has sequence type '" + type_sequence + "'.")
             ifo_input_filename_list.append(ifo_input_filename)
+            offset_bits_list.append(read_ifo_offset_bits(ifo_input_filename))
 
-            # check idx input file, uncompressing it if it was compressed
-            idx_input_filename = prefix + ".idx"
-            readable = check_idx_file(idx_input_filename)
-            if not readable:
-                print_error("File " + idx_input_filename + " not found (even compressed).")
+            # check idx input file, possibly compressed
+            idx_input_filename = check_idx_file(prefix + ".idx")
+            if idx_input_filename == None:
+                print_error("File " + prefix + ".idx" + " not found (even compressed).")
             idx_input_filename_list.append(idx_input_filename)
 
-            # check dict input file, uncompressing it if it was compressed
-            dict_input_filename = prefix + ".dict"
-            readable = check_dict_file(dict_input_filename)
-            if not readable:
-                print_error("File " + dict_input_filename + " not found (even compressed).")
+            # check dict input file, possibly compressed
+            dict_input_filename = check_dict_file(prefix + ".dict")
+            if dict_input_filename == None:
+                print_error("File " + prefix + ".dict" + " not found (even compressed).")
             dict_input_filename_list.append(dict_input_filename)
 
+            # check syn input file, which is optional
+            syn_input_filename = prefix + ".syn"
+            if not check_existence(syn_input_filename):
+                syn_input_filename = None
+            syn_input_filename_list.append(syn_input_filename)
+
     if input_format == 'xml':
         xml_input_filename_list = []
         for prefix in prefix_list:
@@ -1827,17 +3452,18 @@ def main():
         dict_input_filename_list = []
         for prefix in prefix_list:
             # check idx input file, uncompressing it if it was compressed
-            idx_input_filename = prefix + ".dict.idx"
-            readable = check_idx_file(idx_input_filename)
-            if not readable:
-                print_error("File " + idx_input_filename + " not found (even compressed).")
+            # (SQLite cannot read a compressed index)
+            idx_input_filename = check_idx_file(prefix + ".dict.idx")
+            if idx_input_filename == None:
+                print_error("File " + prefix + ".dict.idx" + " not found (even compressed).")
+            if idx_input_filename.endswith(".gz"):
+                idx_input_filename = gunzip_file(idx_input_filename)
             idx_input_filename_list.append(idx_input_filename)
 
-            # check dict input file, uncompressing it if it was compressed
-            dict_input_filename = prefix + ".dict"
-            readable = check_dict_file(dict_input_filename)
-            if not readable:
-                print_error("File " + dict_input_filename + " not found (even compressed).")
+            # check dict input file, possibly compressed
+            dict_input_filename = check_dict_file(prefix + ".dict")
+            if dict_input_filename == None:
+                print_error("File " + prefix + ".dict" + " not found (even compressed).")
             dict_input_filename_list.append(dict_input_filename)
 
     if input_format == 'kobo':
@@ -1855,6 +3481,8 @@ def main():
             print_error("CSV field separator must have length at least one.")
         if len(ls) < 1:
             print_error("CSV line separator must have length at least one.")
+        if (quote != None) and (len(quote) < 1):
+            print_error("CSV quote must have length at least one.")
         
         csv_input_filename_list = []
         for prefix in prefix_list:
@@ -1901,6 +3529,7 @@ def main():
         existing = existing or check_existence(dictionary_filename)
         existing = existing or check_existence(index_filename)
         existing = existing or check_existence(info_filename)
+        existing = existing or check_existence(prefix_list[0] + ".syn")
         existing = existing or check_existence(compressed_dictionary_filename)
         if existing:
             dictionary_filename = "new." + dictionary_filename
@@ -1945,6 +3574,8 @@ def main():
             print_error("CSV field separator must have length at least one!")
         if len(ls) < 1:
             print_error("CSV line separator must have length at least one.")
+        if (quote != None) and (len(quote) < 1):
+            print_error("CSV quote must have length at least one.")
 
         dictionary_filename = prefix_list[0] + ".csv"
         index_filename = ''
@@ -1997,43 +3628,67 @@ def main():
 
     # read input files
     print_info('Reading input dictionaries...')
-    # data = [ [word, definition] ]
-    data = []
+    # when there are several input dictionaries, the jobs are used to read
+    # them in parallel, hence each of them is read by a single job
+    if len(prefix_list) > 1:
+        reader_jobs = 1
+    else:
+        reader_jobs = jobs
+    # tasks = [ (read_function, arguments) ]
+    tasks = []
     if input_format == 'sd':
         for i in range(len(prefix_list)):
             idx_input_filename = idx_input_filename_list[i]
             dict_input_filename = dict_input_filename_list[i]
-            data += read_from_stardict_format(idx_input_filename, dict_input_filename, ignore_case)
+            syn_input_filename = syn_input_filename_list[i]
+            offset_bits = offset_bits_list[i]
+            tasks += [ (read_from_stardict_format, (idx_input_filename, dict_input_filename, syn_input_filename, offset_bits, ignore_case)) ]
 
     if input_format == 'xml':
         for i in range(len(prefix_list)):
             xml_input_filename = xml_input_filename_list[i]
-            data += read_from_xml_format(xml_input_filename, ignore_case)
+            tasks += [ (read_from_xml_format, (xml_input_filename, ignore_case, reader_jobs)) ]
 
     if input_format == 'odyssey':
         for i in range(len(prefix_list)):
             idx_input_filename = idx_input_filename_list[i]
             dict_input_filename = dict_input_filename_list[i]
-            data += read_from_odyssey_format(idx_input_filename, dict_input_filename, ignore_case)
+            tasks += [ (read_from_odyssey_format, (idx_input_filename, dict_input_filename, ignore_case)) ]
 
     if input_format == 'kobo':
         for i in range(len(prefix_list)):
             kobo_input_filename = kobo_input_filename_list[i]
-            data += read_from_kobo_format(kobo_input_filename, ignore_case)
+            tasks += [ (read_from_kobo_format, (kobo_input_filename, ignore_case, reader_jobs)) ]
     
     if input_format == 'csv':
         for i in range(len(prefix_list)):
             csv_input_filename = csv_input_filename_list[i]
-            data += read_from_csv_format(csv_input_filename, fs, ls, ignore_case)
+            tasks += [ (read_from_csv_format, (csv_input_filename, fs, ls, quote, ignore_case, reader_jobs)) ]
+
+    # data = [ [word, definition] ], read one entry at a time
+    data = read_input_dictionaries(tasks, jobs)
+
+    # the sorter used by the writers needing sorted data
+    if sort_memory != None:
+        sorter = externalSorter(sort_memory * 1048576, jobs=jobs)
+    elif jobs > 1:
+        sorter = parallelSorter(jobs)
+    else:
+        sorter = sort_in_memory
 
 
     # parse input files
+    # (the built-in parser, the readers and the writers process one entry at a time,
+    # hence the input data is actually read and parsed while writing the output)
     print_info('Parsing the input data...')
     parsed_data = []
     if parser == None:
         print_info('Using the built-in parser...')
-        for d in data:
-            parsed_data += [ [ d[0], True, [], [], d[1] ] ]
+        # every entry is included, with the synonyms read from the input (if any)
+        parsed_data = parse_entries(data)
+        if isinstance(data, sortedEntries):
+            # the words, hence their order, are not changed
+            parsed_data = sortedEntries(parsed_data)
     else:
         print_info("Using the custom parser defined in " + parser_filename + " ...")
         parsed_data = parser.parse(data, type_sequence, ignore_case)
@@ -2042,7 +3697,7 @@ def main():
     # write out to Odyssey format
     if output_format == 'odyssey':
         print_info('Outputting in Odyssey format to file...')
-        write_to_odyssey_format(config, parsed_data, collation, debug)
+        write_to_odyssey_format(config, parsed_data, collation, sorter, debug)
         print_info("Files " + dictionary_filename + " and " + index_filename + " created successfully!")
 
         # create zip .install file, if the user asked for it
@@ -2053,7 +3708,7 @@ def main():
     # write out to StarDict format
     if output_format == 'sd':
         print_info('Outputting in StarDict format to file...')
-        write_to_stardict_format(config, parsed_data, debug)
+        write_to_stardict_format(config, parsed_data, sorter, debug)
         delete_uncompressed = not debug
         return_code = compress_StarDict_dictionary(dictionary_filename, compressed_dictionary_filename, delete_uncompressed)
 
@@ -2065,25 +3720,25 @@ def main():
     # write out to XML format
     if output_format == 'xml':
         print_info('Outputting in XML format to file...')
-        write_to_xml_format(config, parsed_data, debug)
+        write_to_xml_format(config, parsed_data, sorter, debug)
         print_info("File " + dictionary_filename + " created successfully!")
 
     # write out to Kobo format
     if output_format == 'kobo':
         print_info('Outputting in Kobo format to file...')
-        write_to_kobo_format(config, parsed_data, debug)
+        write_to_kobo_format(config, parsed_data, sorter, debug)
         print_info("File " + compressed_dictionary_filename + " created successfully!")
     
     # write out to CSV format
     if output_format == 'csv':
         print_info('Outputting in CSV format to file...')
-        write_to_csv_format(config, parsed_data, fs, ls, debug)
+        write_to_csv_format(config, parsed_data, fs, ls, quote, sorter, debug)
         print_info("File " + dictionary_filename + " created successfully!")
     
     # write out to EPUB format
     if output_format == 'epub':
         print_info('Outputting in EPUB format to file...')
-        write_to_epub_format(config, parsed_data, debug)
+        write_to_epub_format(config, parsed_data, sorter, debug)
         print_info("File " + dictionary_filename + " created successfully!")
 ### END main ###
 